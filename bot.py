@@ -1,28 +1,47 @@
 import asyncio
 import logging
+from datetime import datetime
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from database.db import init_db
-from scheduler.jobs import check_deadlines, send_daily_problems
+from database.fsm_storage import SQLiteStorage
+from database.db import init_db, close_db, run_backfills
+from cache.leaderboard import load_leaderboard, verify_leaderboard
+from cache.catalog import load_catalog
+from scheduler.jobs import resume_outbox
+from scheduler.archive import process_pending
+from scheduler.imaging import shutdown_pool
+from scheduler.retention import run_retention
+from scheduler.review import reassign_stale
+from utils.media import clear_tmp
+from scheduler.timers import scheduler, restore_timers
 from handlers.admin import admin_router
 from handlers.user import user_router
 from handlers.common import common_router
-from config.settings import TIMEZONE, BOT_TOKEN  # BOT_TOKEN ni settings.py dan import qilamiz
+from config.settings import TIMEZONE, LEADERBOARD_VERIFY_MINUTES, FSM_FLUSH_SECONDS, SUBMISSION_ARCHIVE, BOT_TOKEN  # BOT_TOKEN ni settings.py dan import qilamiz
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+async def start_timers():
+    # Timers read the epoch timestamp columns, so they are rebuilt once backfills have filled them.
+    # Publishing and deadlines run as one-shot timers per problem; missed ones fire right away
+    await run_backfills()
+    await restore_timers()
+
 async def main():
     # Initialize database
     init_db()
+    clear_tmp()
+    # Rankings and the problem catalog are served from memory and updated in place on every change
+    await load_leaderboard()
+    await load_catalog()
     
     # Initialize bot
     bot = Bot(token=BOT_TOKEN)
     
     # Initialize dispatcher with bot
-    dp = Dispatcher(storage=MemoryStorage())
+    # Conversation state lives in SQLite so registrations, submissions and drafts survive restarts
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
     
     # Include routers
     dp.include_router(common_router)
@@ -30,13 +49,30 @@ async def main():
     dp.include_router(admin_router)
     
     # Setup scheduler
-    scheduler = AsyncIOScheduler(timezone=TIMEZONE)
-    scheduler.add_job(check_deadlines, "interval", minutes=30)
-    scheduler.add_job(send_daily_problems, CronTrigger(hour=0, minute=0, second=0))
+    # Finish any fan-out interrupted by a restart, then keep draining new outbox rows
+    scheduler.add_job(resume_outbox, "interval", minutes=1, next_run_time=datetime.now(TIMEZONE))
+    # Chunked data backfills from schema migrations run while the bot keeps serving
+    scheduler.add_job(start_timers, next_run_time=datetime.now(TIMEZONE))
+    scheduler.add_job(verify_leaderboard, "interval", minutes=LEADERBOARD_VERIFY_MINUTES)
+    scheduler.add_job(storage.flush, "interval", seconds=FSM_FLUSH_SECONDS)
+    scheduler.add_job(storage.purge_expired, "interval", hours=1, next_run_time=datetime.now(TIMEZONE))
+    if SUBMISSION_ARCHIVE:
+        # Resumes submission archiving, normalization and review delivery that failed or was interrupted
+        scheduler.add_job(process_pending, "interval", minutes=10, args=[bot], next_run_time=datetime.now(TIMEZONE))
+    # Packs old reviewed submissions, drops stale exports and keeps media under its disk quota
+    scheduler.add_job(run_retention, "cron", hour=4)
+    # Hands unclaimed submissions to another reviewer and frees abandoned claims
+    scheduler.add_job(reassign_stale, "interval", minutes=1, args=[bot])
     scheduler.start()
     
     # Start polling
-    await dp.start_polling(bot)  # bot ni ham beramiz
+    try:
+        await dp.start_polling(bot)  # bot ni ham beramiz
+    finally:
+        scheduler.shutdown(wait=False)
+        await storage.close()
+        shutdown_pool()
+        close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,70 @@
+import logging
+from bisect import bisect_right, insort
+from collections import namedtuple
+from database.db import fetch_all
+
+logger = logging.getLogger(__name__)
+
+Problem = namedtuple("Problem", "id text image_path difficulty category deadline_ts scheduled_ts photo_file_id")
+
+_COLUMNS = ", ".join(Problem._fields)
+
+
+class ProblemCatalog:
+    # Problems only change when an admin creates or publishes one, so browsing is served from here.
+    # Ids are AUTOINCREMENT, so id order is creation order
+    def __init__(self):
+        self._by_id = {}
+        self._ids = []
+        self._by_category = {}
+        self._deadlines = []
+
+    def load(self, rows):
+        self._by_id = {}
+        self._ids = []
+        self._by_category = {}
+        self._deadlines = []
+        for row in sorted(rows):
+            self.add(Problem(*row))
+
+    def add(self, problem):
+        old = self._by_id.get(problem.id)
+        self._by_id[problem.id] = problem
+        if old is not None:
+            return
+        self._ids.append(problem.id)
+        self._by_category.setdefault(problem.category, []).append(problem.id)
+        if problem.deadline_ts is not None:
+            insort(self._deadlines, (problem.deadline_ts, problem.id))
+
+    def update(self, problem_id, **fields):
+        # Category and deadline never change after creation, so the indexes stay valid
+        problem = self._by_id.get(problem_id)
+        if problem is not None:
+            self._by_id[problem_id] = problem._replace(**fields)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, problem_id):
+        return self._by_id.get(problem_id)
+
+    def categories(self):
+        return sorted(self._by_category)
+
+    def latest(self, limit, category=None):
+        ids = self._by_category.get(category, []) if category is not None else self._ids
+        return [self._by_id[pid] for pid in reversed(ids[-limit:])]
+
+    def active(self, now):
+        # Problems whose deadline is still ahead, soonest first
+        start = bisect_right(self._deadlines, (now, float("inf")))
+        return [self._by_id[pid] for _, pid in self._deadlines[start:]]
+
+
+catalog = ProblemCatalog()
+
+
+async def load_catalog():
+    catalog.load(await fetch_all(f"SELECT {_COLUMNS} FROM problems"))
+    logger.info(f"Problem catalog loaded with {len(catalog)} problems")
@@ -0,0 +1,23 @@
+from cache.profiles import invalidate_profiles
+from cache.panels import invalidate_panels
+from cache.phashes import trees
+
+# Write paths report what they changed here; each cache drops exactly what that change affects
+
+
+def user_changed(*user_ids):
+    # Registration, language, submissions, reviews or balance of these users changed
+    if not user_ids:
+        return
+    invalidate_profiles(*user_ids)
+    invalidate_panels(*user_ids)
+
+
+def submission_removed(problem_id):
+    # A deleted submission's hash stays in the problem's BK-tree and would keep matching new uploads
+    trees.invalidate(problem_id)
+
+
+def problems_changed():
+    # A problem was created or published, or a deadline passed: every panel may list it differently
+    invalidate_panels()
@@ -0,0 +1,74 @@
+import logging
+from bisect import bisect_left, insort
+from database.db import fetch_all
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    # Users kept in a sorted array of (-coins, user_id): top-K is a slice and a user's rank is one bisect
+    def __init__(self):
+        self._order = []
+        self._coins = {}
+        self._names = {}
+
+    def load(self, rows):
+        self._coins = {user_id: coins for user_id, _, _, coins in rows}
+        self._names = {user_id: f"{first_name} {last_name}" for user_id, first_name, last_name, _ in rows}
+        self._order = sorted((-coins, user_id) for user_id, coins in self._coins.items())
+
+    def update(self, user_id, coins, name=None):
+        if name is not None:
+            self._names[user_id] = name
+        old = self._coins.get(user_id)
+        if old == coins:
+            return
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, user_id))]
+        self._coins[user_id] = coins
+        insort(self._order, (-coins, user_id))
+
+    def __len__(self):
+        return len(self._order)
+
+    def _entry(self, index):
+        coins, user_id = self._order[index]
+        return index + 1, user_id, self._names.get(user_id, str(user_id)), -coins
+
+    def top(self, k):
+        # [(rank, user_id, name, coins)]
+        return [self._entry(i) for i in range(min(k, len(self._order)))]
+
+    def rank(self, user_id):
+        coins = self._coins.get(user_id)
+        if coins is None:
+            return None
+        return bisect_left(self._order, (-coins, user_id)) + 1
+
+    def neighbours(self, user_id, radius=1):
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - radius)
+        return [self._entry(i) for i in range(start, min(len(self._order), rank + radius))]
+
+    def diff(self, rows):
+        # User ids whose cached balance disagrees with the given (user_id, coins) rows
+        db = dict(rows)
+        return {user_id for user_id in db.keys() | self._coins.keys() if db.get(user_id) != self._coins.get(user_id)}
+
+
+leaderboard = Leaderboard()
+
+
+async def load_leaderboard():
+    leaderboard.load(await fetch_all("SELECT user_id, first_name, last_name, coins FROM users"))
+    logger.info(f"Leaderboard loaded with {len(leaderboard)} users")
+
+
+async def verify_leaderboard():
+    # Safety net against missed updates: compare with the DB and rebuild on any drift
+    mismatched = leaderboard.diff(await fetch_all("SELECT user_id, coins FROM users"))
+    if mismatched:
+        logger.warning(f"Leaderboard drifted for {len(mismatched)} users, reloading")
+        await load_leaderboard()
@@ -0,0 +1,34 @@
+from config.settings import PANEL_CACHE_SIZE, PANEL_CACHE_TTL
+from cache.lru import LRUCache, MISSING
+
+# user_id -> (language, day, rendered panel text). A stored entry only serves the same language
+# and calendar day; everything else about it is kept fresh by cache.events
+panels = LRUCache(PANEL_CACHE_SIZE, PANEL_CACHE_TTL)
+
+# Bumped on every invalidation, so a render that raced with a change is not stored
+_epoch = 0
+
+
+def get_panel(user_id, language, day):
+    entry = panels.get(user_id)
+    if entry is MISSING or entry[:2] != (language, day):
+        return None
+    return entry[2]
+
+
+def panel_epoch():
+    return _epoch
+
+
+def store_panel(user_id, language, day, text, epoch):
+    if epoch == _epoch:
+        panels.set(user_id, (language, day, text))
+
+
+def invalidate_panels(*user_ids):
+    global _epoch
+    _epoch += 1
+    if user_ids:
+        panels.invalidate(*user_ids)
+    else:
+        panels.clear()
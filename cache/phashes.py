@@ -0,0 +1,103 @@
+import logging
+from config.settings import PHASH_DISTANCE, PHASH_TREES, PHASH_TREE_TTL
+from database.db import fetch_all
+from cache.lru import LRUCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Hashes are unsigned 64-bit values; SQLite integers are signed, so they are stored shifted into range
+_SIGN = 1 << 63
+_MASK = (1 << 64) - 1
+
+
+def to_db(value):
+    return value - (1 << 64) if value >= _SIGN else value
+
+
+def from_db(value):
+    return value & _MASK
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    # Metric tree over Hamming distance. Each child hangs off its parent under their distance, so by
+    # the triangle inequality a search only descends into edges within `radius` of the query's own
+    # distance to the node and skips the rest of the tree
+    def __init__(self):
+        self._root = None  # [hash, item, {distance: child}]
+        self.size = 0
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        # [(distance, item)] for every stored hash within `radius`
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.append((distance, item))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+# problem_id -> BKTree of (phash, submission_id); built from the database on first use
+trees = LRUCache(PHASH_TREES, PHASH_TREE_TTL)
+
+
+async def _tree(problem_id):
+    tree = trees.get(problem_id)
+    if tree is not MISSING:
+        return tree
+    rows = await fetch_all(
+        "SELECT id, phash FROM submissions WHERE problem_id=? AND phash IS NOT NULL",
+        (problem_id,)
+    )
+    # Another task may have built it while this one was reading
+    tree = trees.get(problem_id)
+    if tree is MISSING:
+        tree = BKTree()
+        for submission_id, value in rows:
+            tree.add(from_db(value), submission_id)
+        trees.set(problem_id, tree)
+    return tree
+
+
+async def find_duplicate(problem_id, submission_id, value):
+    # Registers a submission's hash; returns the closest submission by another user within PHASH_DISTANCE
+    tree = await _tree(problem_id)
+    matches = dict((item, distance) for distance, item in tree.search(value, PHASH_DISTANCE) if item != submission_id)
+    tree.add(value, submission_id)
+    if not matches:
+        return None
+    # The tree may still hold submissions deleted since it was built, and a user resubmitting the
+    # same picture is not copying anyone
+    rows = await fetch_all(
+        f"SELECT id FROM submissions WHERE id IN ({', '.join('?' * len(matches))}) "
+        "AND user_id != (SELECT user_id FROM submissions WHERE id=?)",
+        (*matches, submission_id)
+    )
+    if not rows:
+        return None
+    duplicate_of = min((row[0] for row in rows), key=lambda item: (matches[item], item))
+    logger.info(f"Submission #{submission_id} is {matches[duplicate_of]} bits from #{duplicate_of}")
+    return duplicate_of
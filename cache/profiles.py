@@ -0,0 +1,53 @@
+import logging
+import sqlite3
+from collections import namedtuple
+from config.settings import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+from database.db import fetch_one, fetch_all
+from cache.lru import LRUCache, MISSING
+from utils.i18n import resolve_language
+
+logger = logging.getLogger(__name__)
+
+# Snapshot of what the menus show about a user; `statuses` maps submission status -> count
+Profile = namedtuple("Profile", "user_id first_name last_name coins language statuses")
+
+# Unregistered users are cached as None too, so registration must invalidate the entry
+profiles = LRUCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+# Bumped on every invalidation, so a read that raced with a change is not stored
+_epoch = 0
+
+
+async def get_profile(user_id):
+    # Read-through: served from memory until the TTL runs out or a write invalidates it
+    profile = profiles.get(user_id)
+    if profile is not MISSING:
+        return profile
+    epoch = _epoch
+    row = await fetch_one("SELECT first_name, last_name, coins, language FROM users WHERE user_id=?", (user_id,))
+    if row is None:
+        profile = None
+    else:
+        rows = await fetch_all(
+            "SELECT status, COUNT(*) FROM submissions WHERE user_id=? GROUP BY status", (user_id,)
+        )
+        profile = Profile(user_id, *row, dict(rows))
+    if epoch == _epoch:
+        profiles.set(user_id, profile)
+    return profile
+
+
+def invalidate_profiles(*user_ids):
+    global _epoch
+    _epoch += 1
+    profiles.invalidate(*user_ids)
+
+
+async def user_language(user_id, fallback=None):
+    # Registered users use their stored language; others get `fallback` (e.g. Telegram's language_code)
+    try:
+        profile = await get_profile(user_id)
+    except sqlite3.Error as e:
+        logger.error(f"Could not resolve language for user {user_id}: {e}")
+        profile = None
+    return resolve_language(profile.language if profile else fallback)
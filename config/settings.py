@@ -22,4 +22,83 @@ COINS_PER_DIFFICULTY = {
 }
 COIN_PENALTY = 2  # Penalty for missing a task
 WELCOME_IMAGE = "submissions/welcome.jpg"
-SUPPORTED_LANGUAGES = ["uz", "en"]
\ No newline at end of file
+SUPPORTED_LANGUAGES = ["uz", "en"]
+
+# Broadcast tuning (Telegram allows ~30 messages per second per bot)
+BROADCAST_RATE_LIMIT = 28
+BROADCAST_CONCURRENCY = 20
+BROADCAST_MAX_RETRIES = 3
+OUTBOX_BATCH_SIZE = 500
+
+# Deadline reminders go out this many hours before each problem's deadline
+REMINDER_LEAD_HOURS = [6, 1]
+
+# Online backfills: rows rewritten per transaction and pause between chunks (seconds)
+BACKFILL_BATCH_SIZE = 2000
+BACKFILL_PAUSE = 0.05
+
+# The in-memory leaderboard is compared against the users table this often (minutes)
+LEADERBOARD_VERIFY_MINUTES = 60
+
+# Per-user profile snapshots (registration, name, coins, submission counts): entries and lifetime (seconds)
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TTL = 300
+
+# Message catalogs: <LOCALES_DIR>/<language>.json; keys missing in a language fall back to DEFAULT_LANGUAGE
+LOCALES_DIR = Path("locales")
+DEFAULT_LANGUAGE = "uz"
+
+# Parameterised keyboards (e.g. submit buttons per problem) kept in memory before LRU eviction
+KEYBOARD_CACHE_SIZE = 1024
+
+# Rendered user panels: entries and lifetime (seconds); changes invalidate them earlier
+PANEL_CACHE_SIZE = 10000
+PANEL_CACHE_TTL = 600
+
+# FSM storage: conversations idle longer than FSM_STATE_TTL (seconds) are dropped; the hot tier keeps
+# FSM_HOT_SIZE active ones in memory and changes reach SQLite every FSM_FLUSH_SECONDS
+FSM_STATE_TTL = 24 * 3600
+FSM_HOT_SIZE = 5000
+FSM_FLUSH_SECONDS = 2
+
+# Keep a local copy of every submission photo; downloads run in the background, this many at a time
+SUBMISSION_ARCHIVE = True
+ARCHIVE_CONCURRENCY = 4
+
+# Content-addressed media store: blobs are named by SHA-256 and sharded as MEDIA_DIR/ab/cd/<hash><ext>
+MEDIA_DIR = Path("media")
+MEDIA_SHARD_DEPTH = 2
+MEDIA_MAX_BYTES = 8 * 1024 * 1024
+
+# Stored images are re-encoded as JPEG no larger than IMAGE_MAX_SIDE, with a THUMB_MAX_SIDE thumbnail,
+# on a pool of IMAGE_WORKERS processes
+IMAGE_NORMALIZE = True
+IMAGE_MAX_SIDE = 1600
+IMAGE_QUALITY = 85
+THUMB_MAX_SIDE = 320
+THUMB_QUALITY = 70
+IMAGE_WORKERS = 2
+
+# Retention: age in seconds after which each kind of file is packed or removed
+RETENTION_POLICIES = {
+    "reviewed_submissions": 30 * 24 * 3600,  # packed into ARCHIVES_DIR
+    "exports": 24 * 3600,                    # stats_*.xlsx in SUBMISSIONS_DIR, deleted
+    "partial_downloads": 24 * 3600,          # leftovers in MEDIA_DIR/tmp, deleted
+}
+RETENTION_BATCH = 2000
+ARCHIVES_DIR = Path("archives")
+# MEDIA_DIR + ARCHIVES_DIR budget; above it reviewed files are packed early and the least recently read
+# archives evicted
+MEDIA_QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+
+# Near-duplicate submissions: perceptual hashes within this Hamming distance (of 64 bits) are flagged;
+# per-problem BK-trees are kept for the PHASH_TREES most recently checked problems
+PHASH_DISTANCE = 6
+PHASH_TREES = 200
+PHASH_TREE_TTL = 24 * 3600
+
+# Review queue: submissions go to the ADMIN_IDS reviewer with the fewest outstanding items; one not
+# claimed within REVIEW_CLAIM_TIMEOUT moves on to a reviewer who has not had it yet (it stays with the
+# last one once every reviewer has), and a claim with no verdict expires after REVIEW_CLAIM_TTL
+REVIEW_CLAIM_TIMEOUT = 15 * 60
+REVIEW_CLAIM_TTL = 30 * 60
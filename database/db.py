@@ -1,51 +1,216 @@
+import asyncio
 import sqlite3
 import os
-from config.settings import DB_PATH, SUBMISSIONS_DIR
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import DB_PATH, SUBMISSIONS_DIR, BACKFILL_BATCH_SIZE, BACKFILL_PAUSE
+from database.migrations import MIGRATIONS, BACKFILLS
+
+# One long-lived connection, used only from a single worker thread so the event loop never blocks on SQLite
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+_conn = None
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # WAL with NORMAL sync only fsyncs at checkpoints, not on every commit
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+def get_connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        for pragma in PRAGMAS:
+            _conn.execute(pragma)
+    return _conn
+
+def close_db():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+async def fetch_one(query, params=()):
+    return await _run(lambda: get_connection().execute(query, params).fetchone())
+
+async def fetch_all(query, params=()):
+    return await _run(lambda: get_connection().execute(query, params).fetchall())
+
+def _in_transaction(func, *args):
+    conn = get_connection()
+    try:
+        result = func(conn.cursor(), *args)
+        conn.commit()
+        return result
+    except BaseException:
+        conn.rollback()
+        raise
+
+async def run_in_transaction(func, *args):
+    # func(cursor, *args) runs start to finish on the DB thread, so nothing else interleaves with it
+    return await _run(_in_transaction, func, *args)
+
+async def execute(query, params=()):
+    # Single write statement in its own transaction; returns the cursor for lastrowid/rowcount
+    return await run_in_transaction(lambda cursor: cursor.execute(query, params))
+
+async def execute_many(query, seq_of_params):
+    return await run_in_transaction(lambda cursor: cursor.executemany(query, seq_of_params))
+
+# name -> (table, columns, unique)
+INDEXES = {
+    "ux_submissions_user_problem": ("submissions", "user_id, problem_id", True),
+    "idx_submissions_user_status": ("submissions", "user_id, status", False),
+    "idx_submissions_problem_status": ("submissions", "problem_id, status", False),
+    "idx_problems_deadline_ts": ("problems", "deadline_ts", False),
+    "idx_problems_scheduled_ts": ("problems", "scheduled_ts", False),
+    "idx_problems_created_at": ("problems", "created_at", False),
+    "idx_problems_category_created": ("problems", "category, created_at", False),
+    "idx_users_coins": ("users", "coins DESC", False),
+    "idx_outbox_status": ("outbox", "status, id", False),
+    "idx_coin_transactions_user": ("coin_transactions", "user_id, id", False),
+}
+
+# Queries on interactive paths; none of them may fall back to a full table scan
+HOT_QUERIES = {
+    "submission_by_user_problem": "SELECT id FROM submissions WHERE user_id=? AND problem_id=?",
+    "submission_stats_by_user": "SELECT status, COUNT(*) FROM submissions WHERE user_id=? GROUP BY status",
+    "submission_stats_by_problem": "SELECT status, COUNT(*) FROM submissions WHERE problem_id=? GROUP BY status",
+    "pending_by_problem": "SELECT id FROM submissions WHERE problem_id=? AND status='pending'",
+    "expired_problems": "SELECT id FROM problems WHERE deadline_ts > ? AND deadline_ts <= ? ORDER BY deadline_ts",
+    "unpublished_problems": "SELECT id, scheduled_ts FROM problems WHERE scheduled_ts IS NOT NULL",
+    "problems_scheduled_between": """
+        SELECT p.id, s.status FROM problems p
+        LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
+        WHERE p.scheduled_ts >= ? AND p.scheduled_ts < ?
+    """,
+    "active_problems": """
+        SELECT p.id, s.status FROM problems p
+        LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
+        WHERE p.deadline_ts > ? ORDER BY p.scheduled_ts ASC
+    """,
+    "latest_problems": """
+        SELECT p.id, s.status FROM problems p
+        LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
+        ORDER BY p.created_at DESC LIMIT 5
+    """,
+    "category_problems": "SELECT id FROM problems WHERE category=? ORDER BY created_at DESC LIMIT 5",
+    "leaderboard": "SELECT first_name, last_name, coins FROM users ORDER BY coins DESC LIMIT 5",
+    "balance_history": "SELECT delta, reason, source_id, balance_after, created_at FROM coin_transactions "
+                       "WHERE user_id=? ORDER BY id DESC LIMIT ?",
+    "window_leaders": "SELECT user_id, SUM(delta) FROM coin_daily WHERE day >= ? AND day < ? GROUP BY user_id",
+    "window_earned": "SELECT SUM(delta) FROM coin_daily WHERE day >= ? AND day < ? AND user_id=?",
+    "unprocessed_submissions": "SELECT id FROM submissions WHERE file_id IS NOT NULL AND "
+                               "(archived_at IS NULL OR normalized_at IS NULL OR notified_at IS NULL) ORDER BY id LIMIT ?",
+    "outbox_batch": "SELECT id FROM outbox WHERE status='pending' AND id > ? ORDER BY id LIMIT ?",
+}
+
+# Unique indexes that could not be created because of existing duplicates; code that relies on
+# one of them for conflict detection must check explicitly while its name is in here
+missing_unique = set()
+
+def ensure_indexes(cursor):
+    for name, (table, columns, unique) in INDEXES.items():
+        try:
+            cursor.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+            )
+            missing_unique.discard(name)
+        except sqlite3.IntegrityError as e:
+            # Existing duplicates block a unique index; keep the lookup fast until they are cleaned up
+            print(f"Could not create unique index {name}, duplicates are checked explicitly: {e}")
+            missing_unique.add(name)
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name.replace('ux_', 'idx_', 1)} ON {table} ({columns})")
+
+def check_query_plans(cursor):
+    # Returns {query name: plan step} for every hot query that scans a table without an index
+    offenders = {}
+    for name, query in HOT_QUERIES.items():
+        cursor.execute(f"EXPLAIN QUERY PLAN {query}", (None,) * query.count("?"))
+        for row in cursor.fetchall():
+            detail = row[-1]
+            if detail.startswith("SCAN ") and " USING " not in detail:
+                offenders[name] = detail
+    return offenders
+
+def migrate(conn):
+    # Apply every migration newer than the stored schema version, each in its own transaction
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN")
+        try:
+            apply(conn.cursor())
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        print(f"Applied schema migration {version}")
 
 def init_db():
+    # Ensure submissions directory exists
+    os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
+
+    conn = get_connection()
+    try:
+        migrate(conn)
+    except sqlite3.Error as e:
+        # Serving a half-migrated schema only moves the failure into every later query
+        print(f"Schema migration failed, not starting: {e}")
+        raise
     try:
-        # Ensure submissions directory exists
-        os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
-        
-        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                phone_number TEXT NOT NULL,
-                coins INTEGER DEFAULT 0,
-                language TEXT DEFAULT 'uz'
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS problems (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                text TEXT NOT NULL,
-                image_path TEXT,
-                difficulty TEXT NOT NULL,
-                category TEXT NOT NULL,
-                deadline TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                scheduled_at TIMESTAMP
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS submissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                problem_id INTEGER,
-                photo_path TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                reviewed_at TIMESTAMP,
-                feedback TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (problem_id) REFERENCES problems(id)
-            )
-        """)
+        ensure_indexes(cursor)
         conn.commit()
+        offenders = check_query_plans(cursor)
     except sqlite3.Error as e:
+        conn.rollback()
         print(f"Database initialization error: {e}")
-    finally:
-        conn.close()
\ No newline at end of file
+        return
+    # A hot query without an index degrades with every row, so the bot refuses to start on one
+    for name, detail in offenders.items():
+        print(f"Hot query '{name}' does a full scan: {detail}")
+    if offenders:
+        raise RuntimeError(f"Hot queries without an index: {', '.join(offenders)}")
+
+def _backfill_chunk(cursor, name, step, after_id):
+    last_id = step(cursor, after_id, BACKFILL_BATCH_SIZE)
+    cursor.execute(
+        "INSERT OR REPLACE INTO job_state (name, value) VALUES (?, ?)",
+        (f"backfill:{name}", "done" if last_id is None else str(last_id))
+    )
+    return last_id
+
+async def run_backfills():
+    # Heavy data rewrites run in small resumable chunks; other queries get the DB between chunks
+    for name, step in BACKFILLS.items():
+        row = await fetch_one("SELECT value FROM job_state WHERE name=?", (f"backfill:{name}",))
+        if row and row[0] == "done":
+            continue
+        after_id = int(row[0]) if row else 0
+        chunks = 0
+        while after_id is not None:
+            try:
+                after_id = await run_in_transaction(_backfill_chunk, name, step, after_id)
+            except (sqlite3.Error, ValueError) as e:
+                # Startup goes on (timers are restored next); the step resumes on the next start
+                print(f"Backfill '{name}' stopped: {e}")
+                break
+            chunks += 1
+            await asyncio.sleep(BACKFILL_PAUSE)
+        print(f"Backfill '{name}' ran {chunks} chunks")
+
+async def set_problem_photo_file_id(problem_id, file_id):
+    # Telegram keeps uploaded photos, so later sends can reference them by file_id
+    try:
+        await execute("UPDATE problems SET photo_file_id=? WHERE id=?", (file_id, problem_id))
+    except sqlite3.Error as e:
+        print(f"Could not store photo file_id for problem #{problem_id}: {e}")
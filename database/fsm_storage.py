@@ -0,0 +1,101 @@
+import copy
+import json
+import logging
+import sqlite3
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from config.settings import FSM_STATE_TTL, FSM_HOT_SIZE
+from database.db import fetch_one, execute, run_in_transaction
+from cache.lru import LRUCache, MISSING
+from utils.timestamps import now_ts
+
+logger = logging.getLogger(__name__)
+
+
+def _key(key: StorageKey):
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+def _write(cursor, changes):
+    upserts = [(k, state, json.dumps(data, ensure_ascii=False), ts)
+               for k, (state, data, ts) in changes.items() if state is not None or data]
+    deletes = [(k,) for k, (state, data, _) in changes.items() if state is None and not data]
+    cursor.executemany("""
+        INSERT INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET state=excluded.state, data=excluded.data, updated_at=excluded.updated_at
+    """, upserts)
+    cursor.executemany("DELETE FROM fsm_state WHERE key=?", deletes)
+
+
+class SQLiteStorage(BaseStorage):
+    # Conversation state kept in SQLite so restarts do not lose half-finished dialogs.
+    # Reads are served from a bounded hot tier; writes are buffered and flushed in batches,
+    # so a crash loses at most one flush interval of changes
+    def __init__(self):
+        self._hot = LRUCache(FSM_HOT_SIZE, FSM_STATE_TTL)
+        self._dirty = {}
+
+    async def _load(self, k):
+        entry = self._hot.get(k)
+        if entry is not MISSING:
+            return entry
+        if k in self._dirty:
+            state, data, _ = self._dirty[k]
+            entry = (state, data)
+        else:
+            row = await fetch_one(
+                "SELECT state, data FROM fsm_state WHERE key=? AND updated_at > ?",
+                (k, now_ts() - FSM_STATE_TTL)
+            )
+            entry = (row[0], json.loads(row[1])) if row else (None, {})
+        self._hot.set(k, entry)
+        return entry
+
+    def _store(self, k, state, data):
+        self._hot.set(k, (state, data))
+        self._dirty[k] = (state, data, now_ts())
+
+    async def set_state(self, key: StorageKey, state=None):
+        k = _key(key)
+        _, data = await self._load(k)
+        self._store(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey):
+        state, _ = await self._load(_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data):
+        k = _key(key)
+        state, _ = await self._load(k)
+        self._store(k, state, copy.deepcopy(data))
+
+    async def get_data(self, key: StorageKey):
+        _, data = await self._load(_key(key))
+        return copy.deepcopy(data)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        changes, self._dirty = self._dirty, {}
+        try:
+            await run_in_transaction(_write, changes)
+        except sqlite3.Error as e:
+            # Put the batch back unless newer changes for the same keys arrived meanwhile
+            for k, change in changes.items():
+                self._dirty.setdefault(k, change)
+            logger.error(f"FSM storage flush failed for {len(changes)} keys: {e}")
+
+    async def purge_expired(self):
+        # Abandoned conversations: the hot tier expires them by TTL, this drops the stored rows
+        try:
+            cursor = await execute("DELETE FROM fsm_state WHERE updated_at <= ?", (now_ts() - FSM_STATE_TTL,))
+        except sqlite3.Error as e:
+            logger.error(f"FSM storage purge failed: {e}")
+            return
+        if cursor.rowcount:
+            logger.info(f"Dropped {cursor.rowcount} abandoned FSM states")
+
+    async def close(self):
+        await self.flush()
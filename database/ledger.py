@@ -0,0 +1,73 @@
+from database.db import fetch_all, fetch_one
+
+# Every coin change is one coin_transactions row keyed by (reason, source_id, user_id).
+# The row carries the resulting balance and the insert trigger copies it onto users.coins,
+# so ledger entry and balance change happen in the same statement and re-applying is a no-op.
+
+
+def record(cursor, user_id, delta, reason, source_id, created_at):
+    # Returns the new balance, or None if this source was already applied to the user
+    cursor.execute("""
+        INSERT OR IGNORE INTO coin_transactions (user_id, delta, reason, source_id, balance_after, created_at)
+        SELECT user_id, ?, ?, ?, coins + ?, ? FROM users WHERE user_id=?
+        RETURNING balance_after
+    """, (delta, reason, source_id, delta, created_at, user_id))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def penalize_non_submitters(cursor, problem_id, amount, created_at, exclude_user_id):
+    # One set-based insert for the whole problem; balances never go below zero, and users with
+    # nothing left to deduct get no ledger row (and so no "0 coins deducted" message)
+    cursor.execute("""
+        INSERT OR IGNORE INTO coin_transactions (user_id, delta, reason, source_id, balance_after, created_at)
+        SELECT u.user_id, -MIN(u.coins, ?), 'penalty', ?, u.coins - MIN(u.coins, ?), ?
+        FROM users u
+        WHERE u.user_id != ? AND u.coins > 0
+          AND NOT EXISTS (SELECT 1 FROM submissions s WHERE s.problem_id=? AND s.user_id=u.user_id)
+    """, (amount, problem_id, amount, created_at, exclude_user_id, problem_id))
+    return cursor.rowcount
+
+
+async def balance_history(user_id, limit=10):
+    return await fetch_all(
+        "SELECT delta, reason, source_id, balance_after, created_at FROM coin_transactions "
+        "WHERE user_id=? ORDER BY id DESC LIMIT ?",
+        (user_id, limit)
+    )
+
+
+async def reason_totals(since=0):
+    # {reason: (entries, coin sum)} for ledger entries created at or after `since`
+    rows = await fetch_all(
+        "SELECT reason, COUNT(*), SUM(delta) FROM coin_transactions WHERE created_at >= ? GROUP BY reason",
+        (since,)
+    )
+    return {reason: (count, total) for reason, count, total in rows}
+
+
+async def balance_drift():
+    # Users whose materialized balance disagrees with their ledger; empty when consistent
+    return await fetch_all("""
+        SELECT u.user_id, u.coins, COALESCE(SUM(t.delta), 0) AS ledger
+        FROM users u LEFT JOIN coin_transactions t ON t.user_id = u.user_id
+        GROUP BY u.user_id HAVING u.coins != ledger
+    """)
+
+
+async def window_leaders(start, end, limit=10):
+    # Top earners over [start, end) from the per-day buckets; bounds are local-midnight epochs
+    return await fetch_all("""
+        SELECT d.user_id, u.first_name, u.last_name, SUM(d.delta) AS earned
+        FROM coin_daily d JOIN users u ON u.user_id = d.user_id
+        WHERE d.day >= ? AND d.day < ?
+        GROUP BY d.user_id ORDER BY earned DESC, d.user_id LIMIT ?
+    """, (start, end, limit))
+
+
+async def window_earned(user_id, start, end):
+    row = await fetch_one(
+        "SELECT COALESCE(SUM(delta), 0) FROM coin_daily WHERE day >= ? AND day < ? AND user_id=?",
+        (start, end, user_id)
+    )
+    return row[0]
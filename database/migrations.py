@@ -0,0 +1,274 @@
+from datetime import datetime
+from config.settings import TIMEZONE
+from utils.timestamps import parse_text, now_ts
+
+# Ordered (version, apply(cursor)) pairs; the applied version is kept in PRAGMA user_version.
+# Migrations must stay cheap (DDL, small updates); large data rewrites belong in BACKFILLS.
+
+def ensure_column(cursor, table, column, definition):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _baseline(cursor):
+    # Schema as it was before versioning; idempotent so existing databases adopt version 1 as-is
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            phone_number TEXT NOT NULL,
+            coins INTEGER DEFAULT 0,
+            language TEXT DEFAULT 'uz'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS problems (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            image_path TEXT,
+            difficulty TEXT NOT NULL,
+            category TEXT NOT NULL,
+            deadline TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            scheduled_at TIMESTAMP,
+            photo_file_id TEXT
+        )
+    """)
+    ensure_column(cursor, "problems", "photo_file_id", "TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            problem_id INTEGER,
+            photo_path TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            reviewed_at TIMESTAMP,
+            feedback TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (problem_id) REFERENCES problems(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            problem_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            UNIQUE (problem_id, user_id, kind)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS penalties (
+            problem_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            applied_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (problem_id, user_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS job_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    # Deadlines that passed before the ledger existed were already charged by the old sweep
+    cursor.execute(
+        "INSERT OR IGNORE INTO job_state (name, value) VALUES ('deadline_sweep', ?)",
+        (datetime.now(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S"),)
+    )
+
+def _epoch_timestamps(cursor):
+    # Integer twins of the TEXT deadline/scheduled_at columns; existing rows are filled by a backfill
+    ensure_column(cursor, "problems", "deadline_ts", "INTEGER")
+    ensure_column(cursor, "problems", "scheduled_ts", "INTEGER")
+    cursor.execute("DROP INDEX IF EXISTS idx_problems_deadline")
+    cursor.execute("DROP INDEX IF EXISTS idx_problems_scheduled_at")
+    cursor.execute("SELECT value FROM job_state WHERE name='deadline_sweep'")
+    row = cursor.fetchone()
+    if row and row[0] and not row[0].isdigit():
+        cursor.execute("UPDATE job_state SET value=? WHERE name='deadline_sweep'", (str(parse_text(row[0])),))
+
+def _backfill_problem_timestamps(cursor, after_id, limit):
+    cursor.execute(
+        "SELECT id, deadline, scheduled_at FROM problems WHERE id > ? AND deadline_ts IS NULL ORDER BY id LIMIT ?",
+        (after_id, limit)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    updates = []
+    for problem_id, deadline, scheduled_at in rows:
+        try:
+            updates.append((parse_text(deadline), parse_text(scheduled_at) if scheduled_at else None, problem_id))
+        except (TypeError, ValueError) as e:
+            # A malformed legacy value keeps its row without timestamps instead of stopping the backfill
+            print(f"Problem #{problem_id} skipped, unreadable deadline/scheduled_at: {e}")
+    cursor.executemany("UPDATE problems SET deadline_ts=?, scheduled_ts=? WHERE id=?", updates)
+    return rows[-1][0]
+
+def _coin_ledger(cursor):
+    # Append-only coin ledger; users.coins becomes a balance materialized by the insert trigger
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS coin_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            balance_after INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            UNIQUE (reason, source_id, user_id)
+        )
+    """)
+    # Existing balances are carried over as one opening entry per user, before the trigger exists
+    cursor.execute("""
+        INSERT OR IGNORE INTO coin_transactions (user_id, delta, reason, source_id, balance_after, created_at)
+        SELECT user_id, coins, 'opening_balance', 0, coins, ? FROM users
+    """, (now_ts(),))
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS coin_transactions_balance
+        AFTER INSERT ON coin_transactions
+        BEGIN
+            UPDATE users SET coins = NEW.balance_after WHERE user_id = NEW.user_id;
+        END
+    """)
+    # The ledger's (reason, source_id, user_id) key now guards against double penalties
+    cursor.execute("DROP TABLE IF EXISTS penalties")
+
+def _daily_coin_buckets(cursor):
+    # Net coins per user per local calendar day, kept current by a trigger on the ledger so
+    # weekly/monthly/custom-range rankings sum a few buckets instead of the whole ledger.
+    # `day` is the epoch second of local midnight, matching utils.timestamps.day_bounds
+    offset = int(datetime.now(TIMEZONE).utcoffset().total_seconds())
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS coin_daily (
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS coin_transactions_daily
+        AFTER INSERT ON coin_transactions
+        WHEN NEW.reason != 'opening_balance'
+        BEGIN
+            INSERT INTO coin_daily (day, user_id, delta)
+            VALUES (NEW.created_at - (NEW.created_at + {offset}) % 86400, NEW.user_id, NEW.delta)
+            ON CONFLICT (day, user_id) DO UPDATE SET delta = delta + excluded.delta;
+        END
+    """)
+    # The ledger is young, so its existing entries are bucketed in one pass
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO coin_daily (day, user_id, delta)
+        SELECT created_at - (created_at + {offset}) % 86400 AS day, user_id, SUM(delta)
+        FROM coin_transactions WHERE reason != 'opening_balance'
+        GROUP BY day, user_id
+    """)
+
+def _fsm_storage(cursor):
+    # Conversation state that survives restarts; one row per storage key
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state (updated_at)")
+
+def _submission_file_ids(cursor):
+    # Submissions are forwarded by Telegram file_id; the local copy is written later by the
+    # archiver, which stamps archived_at. Older rows were saved synchronously and have no file_id
+    ensure_column(cursor, "submissions", "file_id", "TEXT")
+    ensure_column(cursor, "submissions", "file_kind", "TEXT")
+    ensure_column(cursor, "submissions", "archived_at", "INTEGER")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_unarchived ON submissions (id)
+        WHERE archived_at IS NULL AND file_id IS NOT NULL
+    """)
+
+def _submission_pipeline(cursor):
+    # Background stages after archiving: normalized_at stamps re-encoding (thumb_path is set when it
+    # succeeded) and notified_at records that a reviewer received the submission. Rows forwarded
+    # before this migration were all sent to the reviewer on arrival
+    ensure_column(cursor, "submissions", "thumb_path", "TEXT")
+    ensure_column(cursor, "submissions", "normalized_at", "INTEGER")
+    ensure_column(cursor, "submissions", "notified_at", "INTEGER")
+    cursor.execute("UPDATE submissions SET notified_at=0 WHERE file_id IS NOT NULL AND notified_at IS NULL")
+    cursor.execute("DROP INDEX IF EXISTS idx_submissions_unarchived")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_unprocessed ON submissions (id)
+        WHERE file_id IS NOT NULL AND (archived_at IS NULL OR normalized_at IS NULL OR notified_at IS NULL)
+    """)
+    # Shared media blobs are only deleted once no row refers to them
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_submissions_photo_path ON submissions (photo_path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_submissions_thumb_path ON submissions (thumb_path)")
+
+def _retention_index(cursor):
+    # Reviewed submissions whose file is still loose on disk (archive references contain '#'),
+    # oldest review first, so the retention job never rescans rows it already packed
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_unpacked ON submissions (reviewed_at)
+        WHERE status != 'pending' AND photo_path != '' AND instr(photo_path, '#') = 0
+    """)
+
+def _submission_phash(cursor):
+    # Perceptual hash of the submitted image (signed 64-bit) and the closest earlier match, if any
+    ensure_column(cursor, "submissions", "phash", "INTEGER")
+    ensure_column(cursor, "submissions", "duplicate_of", "INTEGER")
+
+def _retention_thumbs(cursor):
+    # Thumbnails are packed with their images, so the retention scan also picks up rows whose
+    # thumbnail is still loose (rows packed before this migration kept theirs on disk)
+    cursor.execute("DROP INDEX IF EXISTS idx_submissions_unpacked")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_unpacked ON submissions (reviewed_at)
+        WHERE status != 'pending'
+          AND ((photo_path != '' AND instr(photo_path, '#') = 0) OR (thumb_path != '' AND instr(thumb_path, '#') = 0))
+    """)
+
+def _review_queue(cursor):
+    # assigned_to/assigned_at: reviewer the submission was sent to and when;
+    # claimed_by/claimed_at: reviewer who pressed approve/reject first and holds it until the verdict
+    ensure_column(cursor, "submissions", "assigned_to", "INTEGER")
+    ensure_column(cursor, "submissions", "assigned_at", "INTEGER")
+    ensure_column(cursor, "submissions", "claimed_by", "INTEGER")
+    ensure_column(cursor, "submissions", "claimed_at", "INTEGER")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submissions_review_queue ON submissions (assigned_to, assigned_at)
+        WHERE status='pending'
+    """)
+
+def _review_offers(cursor):
+    # offered_to: comma-separated reviewers the submission was sent to; reassignments: how often it
+    # moved on unclaimed, so the sweep stops once every reviewer has had it
+    ensure_column(cursor, "submissions", "offered_to", "TEXT")
+    ensure_column(cursor, "submissions", "reassignments", "INTEGER NOT NULL DEFAULT 0")
+
+MIGRATIONS = [
+    (1, _baseline),
+    (2, _epoch_timestamps),
+    (3, _coin_ledger),
+    (4, _daily_coin_buckets),
+    (5, _fsm_storage),
+    (6, _submission_file_ids),
+    (7, _submission_pipeline),
+    (8, _retention_index),
+    (9, _submission_phash),
+    (10, _review_queue),
+    (11, _retention_thumbs),
+    (12, _review_offers),
+]
+
+# name -> step(cursor, after_id, limit): processes up to `limit` rows with id > after_id and
+# returns the last id it handled, or None once nothing is left
+BACKFILLS = {
+    "problem_timestamps": _backfill_problem_timestamps,
+}
@@ -0,0 +1,73 @@
+from database.db import fetch_all, execute
+
+# Pending submissions are spread over the reviewers in ADMIN_IDS by outstanding load. A reviewer
+# claims a submission with one conditional UPDATE when pressing approve or reject, so two reviewers
+# can never both act on it; every verdict is written under the same condition.
+
+
+def assign(cursor, submission_id, reviewers, now, exclude=()):
+    # Picks the reviewer with the fewest pending assignments (ties go to the earlier ADMIN_IDS entry)
+    # and records the assignment; returns the reviewers ordered by load, chosen one first
+    cursor.execute("""
+        SELECT assigned_to, COUNT(*) FROM submissions
+        WHERE status='pending' AND assigned_to IS NOT NULL GROUP BY assigned_to
+    """)
+    load = dict(cursor.fetchall())
+    candidates = [r for r in reviewers if r not in exclude] or list(reviewers)
+    ordered = sorted(candidates, key=lambda r: (load.get(r, 0), reviewers.index(r)))
+    cursor.execute(
+        "UPDATE submissions SET assigned_to=?, assigned_at=? WHERE id=?",
+        (ordered[0], now, submission_id)
+    )
+    return ordered
+
+
+def claim(cursor, submission_id, reviewer_id, now):
+    # True if the submission is still pending and now held by this reviewer
+    cursor.execute("""
+        UPDATE submissions SET claimed_by=?, claimed_at=?
+        WHERE id=? AND status='pending' AND (claimed_by IS NULL OR claimed_by=?)
+    """, (reviewer_id, now, submission_id, reviewer_id))
+    return cursor.rowcount == 1
+
+
+async def release(submission_id, reviewer_id):
+    await execute(
+        "UPDATE submissions SET claimed_by=NULL, claimed_at=NULL WHERE id=? AND claimed_by=? AND status='pending'",
+        (submission_id, reviewer_id)
+    )
+
+
+def expire_claims(cursor, before):
+    # Claims left without a verdict (e.g. a reviewer who never sent rejection feedback)
+    cursor.execute(
+        "UPDATE submissions SET claimed_by=NULL, claimed_at=NULL "
+        "WHERE status='pending' AND claimed_by IS NOT NULL AND claimed_at < ?",
+        (before,)
+    )
+    return cursor.rowcount
+
+
+def offered(offered_to):
+    # Reviewers recorded in the offered_to column
+    return {int(reviewer) for reviewer in (offered_to or "").split(",") if reviewer}
+
+
+async def unclaimed_since(before, max_reassignments, limit=100):
+    # Assigned before `before`, still unclaimed and moved on fewer than `max_reassignments` times:
+    # candidates for reassignment, as (id, assigned_to, offered_to)
+    return await fetch_all("""
+        SELECT id, assigned_to, offered_to FROM submissions
+        WHERE status='pending' AND assigned_to IS NOT NULL AND assigned_at < ? AND claimed_by IS NULL
+          AND reassignments < ?
+        ORDER BY assigned_at LIMIT ?
+    """, (before, max_reassignments, limit))
+
+
+async def queue_stats():
+    # {reviewer: (outstanding, oldest assigned_at)} over pending assigned submissions
+    rows = await fetch_all("""
+        SELECT assigned_to, COUNT(*), MIN(assigned_at) FROM submissions
+        WHERE status='pending' AND assigned_to IS NOT NULL GROUP BY assigned_to
+    """)
+    return {reviewer: (count, oldest) for reviewer, count, oldest in rows}
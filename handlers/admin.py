@@ -1,15 +1,31 @@
 import sqlite3
 import os
+import asyncio
+import zipfile
 import logging
 import pandas as pd
 from datetime import datetime, timedelta
 from aiogram import Router, Bot, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, ReplyKeyboardRemove
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, BufferedInputFile, ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command, or_f
-from config.settings import DB_PATH, ADMIN_IDS, BOT_TOKEN, TIMEZONE, COINS_PER_DIFFICULTY, COIN_PENALTY, SUBMISSIONS_DIR
+from config.settings import ADMIN_IDS, BOT_TOKEN, TIMEZONE, COINS_PER_DIFFICULTY, COIN_PENALTY, SUBMISSIONS_DIR, DEFAULT_LANGUAGE, MEDIA_MAX_BYTES
 from states.states import AdminStates, UserStates
-from callbacks.callbacks import ProblemCB, SubmissionCB, TaskCB
+from callbacks.callbacks import SubmissionCB, TaskCB
+from scheduler.jobs import publish_problem
+from utils.timestamps import now_ts, to_ts, format_ts, day_bounds, week_bounds, month_bounds
+from database import ledger, review_queue
+from cache.leaderboard import leaderboard
+from cache.profiles import profiles, user_language
+from cache.events import user_changed, problems_changed, submission_removed
+from cache.panels import panels
+from utils.i18n import messages
+from utils import keyboards
+from utils.media import store_telegram_file, read_blob, FileTooLarge
+from cache.catalog import catalog, Problem
+from database.db import fetch_one, fetch_all, execute, run_in_transaction
+from scheduler.timers import schedule_problem
+from scheduler.retention import last_report
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
@@ -29,28 +45,8 @@ bot = Bot(
     )
 )
 
-def get_translations():
-    return {
-        "admin_panel": "👑 Admin panel:",
-        "new_problem": "📝 Masala matnini yuboring:",
-        "problem_image": "📸 Masala uchun rasm yuboring (agar kerak bo‘lmasa, /skip deb yozing):",
-        "select_difficulty": "📊 Masala qiyinligini tanlang:",
-        "select_category": "📚 Masala kategoriyasini tanlang:",
-        "send_option": "📤 Masalani qachon yuborishni tanlang:",
-        "problem_saved_scheduled": "✅ Masala #{id} saqlandi! Foydalanuvchilarga {scheduled_at} da yuboriladi.",
-        "problem_sent": "✅ Masala #{id} foydalanuvchilarga yuborildi! Deadline: {deadline}",
-        "error": "⚠️ Xatolik yuz berdi, qayta urinib ko‘ring.",
-        "stats": "📊 Umumiy statistika:\n\n",
-        "user_stats": "👤 Foydalanuvchi statistikasi:\n\n",
-        "select_user": "👤 Foydalanuvchi tanlang:\n\n",
-        "no_users": "📪 Foydalanuvchilar topilmadi.",
-        "feedback_prompt": "Iltimos, rad etish sababini kiriting:",
-        "approved": "✅ Yechim tasdiqlandi! +{coins} tanga qo‘shildi.\n💰 Joriy balans: {total_coins}",
-        "rejected": "❌ Yechim rad etildi.\nSabab: {feedback}\n💰 Joriy balans: {coins}",
-        "invalid_input": "⚠️ Iltimos, to‘g‘ri ma’lumot yuboring!",
-        "excel_generated": "✅ Excel fayl tayyorlandi va yuborildi.",
-        "excel_error": "⚠️ Excel faylni yaratishda xatolik yuz berdi."
-    }
+def get_translations(language=DEFAULT_LANGUAGE):
+    return messages("admin", language)
 
 @admin_router.message(Command("admin"))
 async def admin_panel(message: Message):
@@ -142,24 +138,15 @@ async def receive_problem_image(message: Message, state: FSMContext):
             logger.warning(f"Admin {message.from_user.id} sent unsupported file type or empty message")
             return
 
-        os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        image_path = os.path.join(SUBMISSIONS_DIR, f"problem_{timestamp}{filename_ext}")
-        await bot.download(file_obj.file_id, destination=image_path)
-
-        try:
-            size_bytes = os.path.getsize(image_path)
-            max_mb = 8
-            if size_bytes > max_mb * 1024 * 1024:
-                os.remove(image_path)
-                await message.answer(f"⚠️ Rasm juda katta — maksimal {max_mb} MB bo'lishi kerak.", protect_content=True)
-                logger.warning(f"Admin {message.from_user.id} uploaded too large image ({size_bytes} bytes)")
-                return
-        except OSError as e:
-            logger.warning(f"Could not determine size for {image_path}: {e}")
+        # Oversized files are refused from Telegram's file_size before anything is downloaded
+        image_path = await store_telegram_file(bot, file_obj.file_id, filename_ext, file_obj.file_size)
 
         logger.info(f"Admin {message.from_user.id} uploaded problem image: {image_path}")
 
+    except FileTooLarge as e:
+        await message.answer(f"⚠️ Rasm juda katta — maksimal {MEDIA_MAX_BYTES // (1024 * 1024)} MB bo'lishi kerak.", protect_content=True)
+        logger.warning(f"Admin {message.from_user.id} uploaded too large image ({e.size} bytes)")
+        return
     except (TelegramBadRequest, TelegramNetworkError) as e:
         logger.error(f"Telegram error while admin {message.from_user.id} uploading image: {e}")
         await message.answer(translations["error"], reply_markup=ReplyKeyboardRemove(), protect_content=True)
@@ -203,87 +190,52 @@ async def receive_category(callback: CallbackQuery, state: FSMContext):
     send_immediate = data.get("send_immediate", False)
     now = datetime.now(TIMEZONE)
     if send_immediate:
-        deadline = (now + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
-        scheduled_at = now.strftime("%Y-%m-%d %H:%M:%S")
+        deadline_ts = to_ts(now + timedelta(days=1))
+        scheduled_ts = to_ts(now)
     else:
-        deadline = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%d %H:%M:%S")
+        deadline_ts = to_ts((now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0))
         scheduled_at = now.replace(hour=0, minute=0, second=0, microsecond=0)
         if now.hour >= 0:
             scheduled_at += timedelta(days=1)
-        scheduled_at = scheduled_at.strftime("%Y-%m-%d %H:%M:%S")
+        scheduled_ts = to_ts(scheduled_at)
+    deadline, scheduled_at = format_ts(deadline_ts), format_ts(scheduled_ts)
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO problems (text, image_path, difficulty, category, deadline, scheduled_at) "
-            "VALUES (?, ?, ?, ?, ?, ?)",
+        cursor = await execute(
+            "INSERT INTO problems (text, image_path, difficulty, category, deadline, scheduled_at, deadline_ts, scheduled_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
             (data['problem_text'], data.get('image_path'), data['difficulty'], data['category'], 
-             deadline, scheduled_at)
+             deadline, scheduled_at, deadline_ts, scheduled_ts)
         )
         problem_id = cursor.lastrowid
-        conn.commit()
+        catalog.add(Problem(
+            problem_id, data['problem_text'], data.get('image_path'), data['difficulty'], data['category'],
+            deadline_ts, scheduled_ts, None
+        ))
+        problems_changed()
     except sqlite3.Error as e:
         translations = get_translations()
         await callback.message.edit_text(translations["error"], protect_content=True)
         logger.error(f"Database error saving problem for admin {callback.from_user.id}: {e}")
         return
-    finally:
-        conn.close()
+
+    # Immediate problems are published below, so only the deadline timer is needed for them
+    schedule_problem(problem_id, None if send_immediate else scheduled_ts, deadline_ts)
 
     translations = get_translations()
     if send_immediate:
+        await callback.message.edit_text(translations["problem_sending"].format(id=problem_id), protect_content=True)
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM users")
-            users = [row[0] for row in cursor.fetchall()]
-            coins = COINS_PER_DIFFICULTY.get(data['difficulty'].lower(), COINS_PER_DIFFICULTY["medium"])
-            submit_keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text="✅ Yechim yuborish",
-                        callback_data=ProblemCB(action="submit", problem_id=problem_id).pack()
-                    )]
-                ]
-            )
-            for user_id in users:
-                if user_id != ADMIN_ID:
-                    try:
-                        message_text = (
-                            f"📘 Masala #{problem_id} ({data['category']} - {data['difficulty']}):\n\n"
-                            f"{data['problem_text']}\n\n<i>Deadline: {deadline}\n"
-                            f"🎁 To‘g‘ri yechim uchun {coins} tanga!"
-                        )
-                        if data.get('image_path') and os.path.exists(data['image_path']):
-                            await bot.send_photo(
-                                user_id,
-                                FSInputFile(data['image_path']),
-                                caption=message_text,
-                                reply_markup=submit_keyboard,
-                                protect_content=True
-                            )
-                            logger.info(f"Sent problem #{problem_id} with image to user {user_id}")
-                        else:
-                            await bot.send_message(
-                                user_id,
-                                message_text,
-                                reply_markup=submit_keyboard,
-                                protect_content=True
-                            )
-                            logger.info(f"Sent problem #{problem_id} without image to user {user_id}")
-                    except (TelegramBadRequest, TelegramNetworkError) as e:
-                        logger.error(f"Error sending problem #{problem_id} to user {user_id}: {e}")
-            cursor.execute("UPDATE problems SET scheduled_at=NULL WHERE id=?", (problem_id,))
-            conn.commit()
+            result = await publish_problem(bot, problem_id)
         except sqlite3.Error as e:
             await callback.message.edit_text(translations["error"], protect_content=True)
             logger.error(f"Database error sending immediate problem #{problem_id}: {e}")
             return
-        finally:
-            conn.close()
         await callback.message.edit_text(
-            translations["problem_sent"].format(id=problem_id, deadline=deadline),
+            translations["problem_sent"].format(
+                id=problem_id, deadline=deadline,
+                sent=result.sent, failed=result.failed, elapsed=round(result.elapsed)
+            ),
             protect_content=True
         )
         logger.info(f"Admin {callback.from_user.id} sent immediate problem #{problem_id}")
@@ -295,32 +247,50 @@ async def receive_category(callback: CallbackQuery, state: FSMContext):
         logger.info(f"Admin {callback.from_user.id} scheduled problem #{problem_id} for {scheduled_at}")
     await state.clear()
 
+def _approve(cursor, submission_id, reviewer_id):
+    # None when another reviewer holds or already decided this submission
+    if not review_queue.claim(cursor, submission_id, reviewer_id, now_ts()):
+        return None
+    cursor.execute("SELECT user_id, problem_id FROM submissions WHERE id=?", (submission_id,))
+    user_id, problem_id = cursor.fetchone()
+    cursor.execute("SELECT difficulty FROM problems WHERE id=?", (problem_id,))
+    difficulty = cursor.fetchone()[0]
+    coins_to_add = COINS_PER_DIFFICULTY.get(difficulty.lower(), COINS_PER_DIFFICULTY["medium"])
+
+    cursor.execute("UPDATE submissions SET status='approved', reviewed_at=CURRENT_TIMESTAMP WHERE id=?", 
+                  (submission_id,))
+    # None means this submission was already credited (e.g. a repeated click)
+    coins = ledger.record(cursor, user_id, coins_to_add, "approval", submission_id, now_ts())
+    return user_id, coins_to_add, coins
+
+async def _already_reviewed(callback, submission_id):
+    translations = get_translations(await user_language(callback.from_user.id))
+    await callback.answer(translations["review_taken"], show_alert=True)
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except (TelegramBadRequest, TelegramNetworkError) as e:
+        logger.warning(f"Could not drop review buttons for submission #{submission_id}: {e}")
+    logger.info(f"Admin {callback.from_user.id} lost the claim on submission #{submission_id}")
+
 @admin_router.callback_query(SubmissionCB.filter(F.action == "approve"))
 async def approve_submission(callback: CallbackQuery, callback_data: SubmissionCB):
     submission_id = callback_data.submission_id
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, problem_id FROM submissions WHERE id=?", (submission_id,))
-        user_id, problem_id = cursor.fetchone()
-        cursor.execute("SELECT difficulty FROM problems WHERE id=?", (problem_id,))
-        difficulty = cursor.fetchone()[0]
-        coins_to_add = COINS_PER_DIFFICULTY.get(difficulty.lower(), COINS_PER_DIFFICULTY["medium"])
-        
-        cursor.execute("UPDATE submissions SET status='approved', reviewed_at=CURRENT_TIMESTAMP WHERE id=?", 
-                      (submission_id,))
-        cursor.execute("UPDATE users SET coins = coins + ? WHERE user_id=?", 
-                      (coins_to_add, user_id))
-        cursor.execute("SELECT coins FROM users WHERE user_id=?", (user_id,))
-        coins = cursor.fetchone()[0]
-        conn.commit()
+        result = await run_in_transaction(_approve, submission_id, callback.from_user.id)
     except sqlite3.Error as e:
         translations = get_translations()
         await callback.message.edit_text(translations["error"], protect_content=True)
         logger.error(f"Database error approving submission #{submission_id}: {e}")
         return
-    finally:
-        conn.close()
+    if result is None:
+        await _already_reviewed(callback, submission_id)
+        return
+    user_id, coins_to_add, coins = result
+    user_changed(user_id)
+    if coins is None:
+        logger.info(f"Submission #{submission_id} was already credited, skipping")
+        return
+    leaderboard.update(user_id, coins)
 
     translations = get_translations()
     try:
@@ -329,12 +299,12 @@ async def approve_submission(callback: CallbackQuery, callback_data: SubmissionC
             reply_markup=None,
             protect_content=True
         )
+        # Users are notified in their own language; the admin side stays in the default one
+        user_lang = await user_language(user_id)
         await bot.send_message(
             user_id, 
-            translations["approved"].format(coins=coins_to_add, total_coins=coins),
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            messages("user", user_lang)["approved"].format(coins=coins_to_add, total_coins=coins),
+            reply_markup=keyboards.back(user_lang),
             protect_content=True
         )
         logger.info(f"Admin {callback.from_user.id} approved submission #{submission_id} for user {user_id}")
@@ -344,8 +314,18 @@ async def approve_submission(callback: CallbackQuery, callback_data: SubmissionC
 @admin_router.callback_query(SubmissionCB.filter(F.action == "reject"))
 async def reject_submission(callback: CallbackQuery, callback_data: SubmissionCB, state: FSMContext):
     submission_id = callback_data.submission_id
-    await state.update_data(submission_id=submission_id)
     translations = get_translations()
+    # The claim is taken before feedback is typed, so nobody approves it in the meantime
+    try:
+        claimed = await run_in_transaction(review_queue.claim, submission_id, callback.from_user.id, now_ts())
+    except sqlite3.Error as e:
+        await callback.message.edit_text(translations["error"], protect_content=True)
+        logger.error(f"Database error claiming submission #{submission_id}: {e}")
+        return
+    if not claimed:
+        await _already_reviewed(callback, submission_id)
+        return
+    await state.update_data(submission_id=submission_id)
     try:
         await callback.message.edit_caption(
             caption=f"{callback.message.caption}\n\n{translations['feedback_prompt']}",
@@ -375,34 +355,30 @@ async def receive_feedback(message: Message, state: FSMContext):
         return
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE submissions SET status='rejected', reviewed_at=CURRENT_TIMESTAMP, feedback=? WHERE id=?", 
-                      (feedback, submission_id))
-        cursor.execute("SELECT user_id, coins FROM users WHERE user_id IN "
-                     "(SELECT user_id FROM submissions WHERE id=?)", 
-                     (submission_id,))
-        user_id, coins = cursor.fetchone()
-        conn.commit()
+        cursor = await execute(
+            "UPDATE submissions SET status='rejected', reviewed_at=CURRENT_TIMESTAMP, feedback=? "
+            "WHERE id=? AND status='pending' AND claimed_by=?",
+            (feedback, submission_id, message.from_user.id)
+        )
+        if cursor.rowcount == 0:
+            # The claim expired while feedback was being typed and someone else took the submission
+            translations = get_translations(await user_language(message.from_user.id))
+            await message.answer(translations["review_lost"], protect_content=True)
+            logger.info(f"Admin {message.from_user.id} lost the claim on submission #{submission_id}")
+            await state.clear()
+            return
+        user_id, coins = await fetch_one("SELECT user_id, coins FROM users WHERE user_id IN "
+                                         "(SELECT user_id FROM submissions WHERE id=?)", 
+                                         (submission_id,))
+        user_changed(user_id)
     except sqlite3.Error as e:
         translations = get_translations()
         await message.answer(translations["error"], protect_content=True)
         logger.error(f"Database error saving feedback for submission #{submission_id}: {e}")
         return
-    finally:
-        conn.close()
 
     translations = get_translations()
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="🔄 Qayta yuborish",
-            callback_data=SubmissionCB(action="resubmit", submission_id=submission_id).pack()
-        )],
-        [InlineKeyboardButton(
-            text="🔙 Orqaga",
-            callback_data=TaskCB(action="menu", problem_id=0).pack()
-        )]
-    ])
+    user_lang = await user_language(user_id)
     try:
         await message.bot.edit_message_caption(
             chat_id=message.chat.id,
@@ -413,8 +389,8 @@ async def receive_feedback(message: Message, state: FSMContext):
         )
         await bot.send_message(
             user_id, 
-            translations["rejected"].format(feedback=feedback, coins=coins),
-            reply_markup=keyboard,
+            messages("user", user_lang)["rejected"].format(feedback=feedback, coins=coins),
+            reply_markup=keyboards.resubmit(submission_id, user_lang),
             protect_content=True
         )
         logger.info(f"Admin {message.from_user.id} rejected submission #{submission_id} with feedback")
@@ -424,11 +400,24 @@ async def receive_feedback(message: Message, state: FSMContext):
     await state.clear()
 
 @admin_router.callback_query(SubmissionCB.filter(F.action == "cancel_feedback"))
-async def cancel_feedback(callback: CallbackQuery, callback_data: SubmissionCB):
+async def cancel_feedback(callback: CallbackQuery, callback_data: SubmissionCB, state: FSMContext):
+    await state.clear()
+    try:
+        await review_queue.release(callback_data.submission_id, callback.from_user.id)
+    except sqlite3.Error as e:
+        logger.error(f"Database error releasing submission #{callback_data.submission_id}: {e}")
+    try:
+        # The full-file and comparison buttons come back only if the reviewer had them
+        row = await fetch_one("SELECT thumb_path, duplicate_of FROM submissions WHERE id=?",
+                              (callback_data.submission_id,))
+    except sqlite3.Error as e:
+        row = None
+        logger.error(f"Database error reading submission #{callback_data.submission_id}: {e}")
     try:
         await callback.message.edit_caption(
             caption=f"{callback.message.caption.split('\n\n')[0]}\n\nFeedback bekor qilindi",
-            reply_markup=None,
+            reply_markup=keyboards.review(callback_data.submission_id, await user_language(callback.from_user.id),
+                                          full=bool(row and row[0]), duplicate_of=row[1] if row else None),
             protect_content=True
         )
         logger.info(f"Admin {callback.from_user.id} cancelled feedback for submission #{callback_data.submission_id}")
@@ -437,32 +426,103 @@ async def cancel_feedback(callback: CallbackQuery, callback_data: SubmissionCB):
         await callback.message.edit_text(translations["error"], protect_content=True)
         logger.error(f"Error cancelling feedback for submission #{callback_data.submission_id}: {e}")
 
+@admin_router.callback_query(SubmissionCB.filter(F.action == "full"))
+async def show_full_file(callback: CallbackQuery, callback_data: SubmissionCB):
+    # Reviewers are sent the thumbnail; the user's original file goes out only when asked for
+    submission_id = callback_data.submission_id
+    translations = get_translations(await user_language(callback.from_user.id))
+    try:
+        row = await fetch_one("SELECT file_id, file_kind FROM submissions WHERE id=?", (submission_id,))
+    except sqlite3.Error as e:
+        await callback.answer(translations["error"], show_alert=True)
+        logger.error(f"Database error reading submission #{submission_id}: {e}")
+        return
+    if not row:
+        await callback.answer(translations["error"], show_alert=True)
+        return
+    file_id, file_kind = row
+    send_file = bot.send_photo if file_kind == "photo" else bot.send_document
+    try:
+        await send_file(
+            callback.from_user.id, file_id,
+            caption=translations["review_file"].format(id=submission_id),
+            reply_to_message_id=callback.message.message_id,
+            protect_content=True
+        )
+        await callback.answer()
+    except (TelegramBadRequest, TelegramNetworkError) as e:
+        await callback.answer(translations["error"], show_alert=True)
+        logger.error(f"Error sending full file for submission #{submission_id}: {e}")
+
+@admin_router.callback_query(SubmissionCB.filter(F.action == "match"))
+async def show_match(callback: CallbackQuery, callback_data: SubmissionCB):
+    # The earlier submission a near-copy was flagged against. It has usually been reviewed and packed
+    # already, so its stored image is read back from the media store or its archive
+    submission_id = callback_data.submission_id
+    translations = get_translations(await user_language(callback.from_user.id))
+    try:
+        row = await fetch_one(
+            "SELECT photo_path, thumb_path, file_id, file_kind FROM submissions WHERE id=?", (submission_id,)
+        )
+    except sqlite3.Error as e:
+        await callback.answer(translations["error"], show_alert=True)
+        logger.error(f"Database error reading submission #{submission_id}: {e}")
+        return
+    if not row:
+        await callback.answer(translations["error"], show_alert=True)
+        return
+    photo_path, thumb_path, file_id, file_kind = row
+    send_file = bot.send_photo if file_kind == "photo" else bot.send_document
+    media = file_id
+    if photo_path:
+        try:
+            data = await asyncio.to_thread(read_blob, photo_path)
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            # Evicted or removed meanwhile: the Telegram file_id still identifies the original
+            logger.warning(f"Stored file of submission #{submission_id} unreadable, sending by file_id: {e}")
+        else:
+            media = BufferedInputFile(data, filename=os.path.basename(photo_path.split("#")[-1]))
+            if thumb_path:
+                # Normalized, so a JPEG whatever the user sent
+                send_file = bot.send_photo
+    try:
+        await send_file(
+            callback.from_user.id, media,
+            caption=translations["review_file"].format(id=submission_id),
+            reply_to_message_id=callback.message.message_id,
+            protect_content=True
+        )
+        await callback.answer()
+    except (TelegramBadRequest, TelegramNetworkError) as e:
+        await callback.answer(translations["error"], show_alert=True)
+        logger.error(f"Error sending matched submission #{submission_id}: {e}")
+
+def _delete_submission(cursor, submission_id):
+    cursor.execute("SELECT user_id, problem_id FROM submissions WHERE id=?", (submission_id,))
+    user_id, problem_id = cursor.fetchone()
+    cursor.execute("DELETE FROM submissions WHERE id=?", (submission_id,))
+    return user_id, problem_id
+
 @admin_router.callback_query(SubmissionCB.filter(F.action == "resubmit"))
 async def resubmit_submission(callback: CallbackQuery, callback_data: SubmissionCB, state: FSMContext):
     submission_id = callback_data.submission_id
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, problem_id FROM submissions WHERE id=?", (submission_id,))
-        user_id, problem_id = cursor.fetchone()
-        cursor.execute("DELETE FROM submissions WHERE id=?", (submission_id,))
-        conn.commit()
+        user_id, problem_id = await run_in_transaction(_delete_submission, submission_id)
     except sqlite3.Error as e:
         translations = get_translations()
         await callback.message.edit_text(translations["error"], protect_content=True)
         logger.error(f"Database error resubmitting submission #{submission_id}: {e}")
         return
-    finally:
-        conn.close()
+    user_changed(user_id)
+    submission_removed(problem_id)
 
     await state.update_data(problem_id=problem_id)
     translations = get_translations()
+    user_lang = await user_language(user_id)
     try:
         await callback.message.edit_text(
-            translations.get("submit_prompt", "📸 Yechim rasmini yuboring:"),
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            messages("user", user_lang)["submit_prompt"],
+            reply_markup=keyboards.back(user_lang),
             protect_content=True
         )
         await state.set_state(UserStates.waiting_for_photo)
@@ -474,27 +534,46 @@ async def resubmit_submission(callback: CallbackQuery, callback_data: Submission
 @admin_router.callback_query(F.data == "stats")
 async def show_stats(callback: CallbackQuery):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        cursor.execute("SELECT SUM(coins) FROM users")
-        total_coins = cursor.fetchone()[0] or 0
-        cursor.execute("SELECT id, text, difficulty, category, deadline FROM problems ORDER BY id DESC LIMIT 1")
-        last_problem = cursor.fetchone()
+        total_users, total_coins = await fetch_one("SELECT COUNT(*), COALESCE(SUM(coins), 0) FROM users")
+        last_problem = await fetch_one("SELECT id, text, difficulty, category, deadline FROM problems ORDER BY id DESC LIMIT 1")
         
         translations = get_translations()
         text = translations["stats"]
         text += f"👤 Foydalanuvchilar: {total_users}\n"
         text += f"💰 Umumiy tangalar: {total_coins}\n"
+        totals = await ledger.reason_totals()
+        text += translations["stats_approvals"].format(coins=totals.get('approval', (0, 0))[1])
+        text += translations["stats_penalties"].format(coins=-(totals.get('penalty', (0, 0))[1] or 0))
+        cache = profiles.stats()
+        text += translations["stats_profile_cache"].format(
+            hits=cache['hits'], misses=cache['misses'], rate=cache['hit_rate'], size=cache['size']
+        )
+        cache = panels.stats()
+        text += translations["stats_panel_cache"].format(hits=cache['hits'], misses=cache['misses'], rate=cache['hit_rate'])
+        markups = keyboards.cache_info().values()
+        text += translations["stats_keyboards"].format(
+            hits=sum(i.hits for i in markups), misses=sum(i.misses for i in markups)
+        )
+        queue = await review_queue.queue_stats()
+        if queue:
+            now = now_ts()
+            text += translations["stats_review_queue"].format(count=sum(count for count, _ in queue.values()))
+            for reviewer, (count, oldest) in sorted(queue.items()):
+                text += translations["stats_reviewer"].format(reviewer=reviewer, count=count, minutes=(now - oldest) // 60)
+        retention = await last_report()
+        if retention:
+            text += translations["stats_storage"].format(
+                used=retention['used'] / 1048576, reclaimed=retention['reclaimed'] / 1048576,
+                finished=format_ts(retention['finished_at'])
+            )
         
         if last_problem:
             problem_id, _, diff, cat, deadline = last_problem
-            cursor.execute("""
+            rows = await fetch_all("""
                 SELECT status, COUNT(*) FROM submissions 
                 WHERE problem_id=? GROUP BY status
             """, (problem_id,))
-            stats = {s: c for s, c in cursor.fetchall()}
+            stats = {s: c for s, c in rows}
             text += f"📘 Masala #{problem_id} ({cat} - {diff}):\n"
             text += f"✅ Tasdiqlangan: {stats.get('approved', 0)}\n"
             text += f"❌ Rad etilgan: {stats.get('rejected', 0)}\n"
@@ -503,6 +582,8 @@ async def show_stats(callback: CallbackQuery):
             text += translations["history_empty"] + "\n"
             
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=translations["btn_top_week"], callback_data="stats_top_week"),
+             InlineKeyboardButton(text=translations["btn_top_month"], callback_data="stats_top_month")],
             [InlineKeyboardButton(text="📥 Excel yuklab olish", callback_data="export_stats")],
             [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
         ])
@@ -512,31 +593,68 @@ async def show_stats(callback: CallbackQuery):
         translations = get_translations()
         await callback.message.edit_text(
             translations["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            reply_markup=keyboards.back(),
             protect_content=True
         )
         logger.error(f"Database error in show_stats for admin {callback.from_user.id}: {e}")
-    finally:
-        conn.close()
+
+async def _window_text(title, start, end):
+    # Leaderboard for [start, end) summed from the per-day coin buckets
+    translations = get_translations()
+    leaders = await ledger.window_leaders(start, end, 10)
+    text = translations[title].format(start=format_ts(start)[:10], end=format_ts(end - 1)[:10])
+    if not leaders:
+        return text + translations["top_empty"]
+    for rank, (user_id, first_name, last_name, coins) in enumerate(leaders, 1):
+        text += f"{rank}. {first_name} {last_name} (ID: {user_id}) - {coins} 💰\n"
+    return text
+
+@admin_router.callback_query(F.data.in_({"stats_top_week", "stats_top_month"}))
+async def show_window_leaderboard(callback: CallbackQuery):
+    title = callback.data.removeprefix("stats_")
+    bounds = week_bounds if title == "top_week" else month_bounds
+    keyboard = keyboards.back(action="stats", factory=None)
+    try:
+        text = await _window_text(title, *bounds(datetime.now(TIMEZONE).date()))
+        await callback.message.edit_text(text, reply_markup=keyboard, protect_content=True)
+        logger.info(f"Admin {callback.from_user.id} viewed {title} leaderboard")
+    except sqlite3.Error as e:
+        await callback.message.edit_text(get_translations()["error"], reply_markup=keyboard, protect_content=True)
+        logger.error(f"Database error in show_window_leaderboard for admin {callback.from_user.id}: {e}")
+
+@admin_router.message(Command("top"))
+async def show_range_leaderboard(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("🚫 Faqat adminlar uchun!", protect_content=True)
+        return
+    translations = get_translations()
+    try:
+        first, last = message.text.split()[1:3]
+        start, _ = day_bounds(datetime.strptime(first, "%Y-%m-%d").date())
+        _, end = day_bounds(datetime.strptime(last, "%Y-%m-%d").date())
+    except ValueError:
+        await message.answer(translations["top_usage"], protect_content=True)
+        return
+    if end <= start:
+        await message.answer(translations["top_usage"], protect_content=True)
+        return
+    try:
+        await message.answer(await _window_text("top_range", start, end), protect_content=True)
+        logger.info(f"Admin {message.from_user.id} viewed leaderboard for {first} – {last}")
+    except sqlite3.Error as e:
+        await message.answer(translations["error"], protect_content=True)
+        logger.error(f"Database error in show_range_leaderboard for admin {message.from_user.id}: {e}")
 
 @admin_router.callback_query(F.data == "user_stats")
 async def show_user_stats(callback: CallbackQuery, page: int = 0):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, first_name, last_name FROM users ORDER BY user_id LIMIT 5 OFFSET ?", (page * 5,))
-        users = cursor.fetchall()
-        conn.close()
+        users = await fetch_all("SELECT user_id, first_name, last_name FROM users ORDER BY user_id LIMIT 5 OFFSET ?", (page * 5,))
 
         translations = get_translations()
         if not users:
             await callback.message.edit_text(
                 translations["no_users"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-                ]),
+                reply_markup=keyboards.back(),
                 protect_content=True
             )
             logger.info(f"Admin {callback.from_user.id} viewed user stats: no users found")
@@ -570,9 +688,7 @@ async def show_user_stats(callback: CallbackQuery, page: int = 0):
         translations = get_translations()
         await callback.message.edit_text(
             translations["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            reply_markup=keyboards.back(),
             protect_content=True
         )
         logger.error(f"Database error in show_user_stats for admin {callback.from_user.id}: {e}")
@@ -586,35 +702,28 @@ async def show_user_stats_page(callback: CallbackQuery):
 async def show_user_detail(callback: CallbackQuery):
     user_id = int(callback.data.split("_")[-1])
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT first_name, last_name, phone_number, coins FROM users WHERE user_id=?", (user_id,))
-        user = cursor.fetchone()
+        user = await fetch_one("SELECT first_name, last_name, phone_number, coins FROM users WHERE user_id=?", (user_id,))
         if not user:
             translations = get_translations()
             await callback.message.edit_text(
                 translations["no_users"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data="user_stats")]
-                ]),
+                reply_markup=keyboards.back(action="user_stats", factory=None),
                 protect_content=True
             )
             logger.warning(f"Admin {callback.from_user.id} tried to view non-existent user {user_id}")
             return
 
         first_name, last_name, phone_number, coins = user
-        cursor.execute("""
+        rows = await fetch_all("""
             SELECT status, COUNT(*) FROM submissions 
             WHERE user_id=? GROUP BY status
         """, (user_id,))
-        stats = {s: c for s, c in cursor.fetchall()}
-        cursor.execute("""
+        stats = {s: c for s, c in rows}
+        missed_tasks = (await fetch_one("""
             SELECT COUNT(*) FROM problems p 
             LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
-            WHERE s.id IS NULL AND p.deadline < ?
-        """, (user_id, datetime.now(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S")))
-        missed_tasks = cursor.fetchone()[0]
-        conn.close()
+            WHERE s.id IS NULL AND p.deadline_ts < ?
+        """, (user_id, now_ts())))[0]
 
         translations = get_translations()
         text = translations["user_stats"]
@@ -625,12 +734,16 @@ async def show_user_detail(callback: CallbackQuery):
         text += f"❌ Rad etilgan: {stats.get('rejected', 0)}\n"
         text += f"⏳ Kutmoqda: {stats.get('pending', 0)}\n"
         text += f"⏰ O‘tkazib yuborilgan: {missed_tasks}\n"
+        history = await ledger.balance_history(user_id, limit=5)
+        if history:
+            text += translations["ledger_history"]
+            for delta, reason, source_id, balance_after, created_at in history:
+                label = translations.get(f"ledger_{reason}", reason)
+                text += f"{format_ts(created_at)}: {delta:+d} ({label} #{source_id}) → {balance_after}\n"
         
         await callback.message.edit_text(
             text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="user_stats")]
-            ]),
+            reply_markup=keyboards.back(action="user_stats", factory=None),
             protect_content=True
         )
         logger.info(f"Admin {callback.from_user.id} viewed stats for user {user_id}")
@@ -638,9 +751,7 @@ async def show_user_detail(callback: CallbackQuery):
         translations = get_translations()
         await callback.message.edit_text(
             translations["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="user_stats")]
-            ]),
+            reply_markup=keyboards.back(action="user_stats", factory=None),
             protect_content=True
         )
         logger.error(f"Database error in show_user_detail for admin {callback.from_user.id}, user {user_id}: {e}")
@@ -648,24 +759,25 @@ async def show_user_detail(callback: CallbackQuery):
 @admin_router.callback_query(F.data == "export_stats")
 async def export_stats_to_excel(callback: CallbackQuery):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, first_name, last_name, phone_number, coins FROM users")
-        users = cursor.fetchall()
-        
+        now = now_ts()
+        users = await fetch_all("SELECT user_id, first_name, last_name, phone_number, coins FROM users")
+        # Per-user counts in two grouped queries instead of two queries per user
+        status_rows = await fetch_all("SELECT user_id, status, COUNT(*) FROM submissions GROUP BY user_id, status")
+        submitted_rows = await fetch_all("""
+            SELECT s.user_id, COUNT(DISTINCT s.problem_id) FROM submissions s
+            JOIN problems p ON p.id = s.problem_id
+            WHERE p.deadline_ts < ? GROUP BY s.user_id
+        """, (now,))
+        expired_total = (await fetch_one("SELECT COUNT(*) FROM problems WHERE deadline_ts < ?", (now,)))[0]
+        user_stats = {}
+        for user_id, status, count in status_rows:
+            user_stats.setdefault(user_id, {})[status] = count
+        submitted_expired = dict(submitted_rows)
+
         data = []
         for user_id, first_name, last_name, phone_number, coins in users:
-            cursor.execute("""
-                SELECT status, COUNT(*) FROM submissions 
-                WHERE user_id=? GROUP BY status
-            """, (user_id,))
-            stats = {s: c for s, c in cursor.fetchall()}
-            cursor.execute("""
-                SELECT COUNT(*) FROM problems p 
-                LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
-                WHERE s.id IS NULL AND p.deadline < ?
-            """, (user_id, datetime.now(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S")))
-            missed_tasks = cursor.fetchone()[0]
+            stats = user_stats.get(user_id, {})
+            missed_tasks = expired_total - submitted_expired.get(user_id, 0)
             data.append({
                 "User ID": user_id,
                 "Ism": first_name,
@@ -677,15 +789,12 @@ async def export_stats_to_excel(callback: CallbackQuery):
                 "Kutmoqda": stats.get("pending", 0),
                 "O‘tkazib yuborilgan": missed_tasks
             })
-        conn.close()
 
         if not data:
             translations = get_translations()
             await callback.message.edit_text(
                 translations["no_users"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data="stats")]
-                ]),
+                reply_markup=keyboards.back(action="stats", factory=None),
                 protect_content=True
             )
             logger.info(f"Admin {callback.from_user.id} attempted to export stats: no users found")
@@ -701,9 +810,7 @@ async def export_stats_to_excel(callback: CallbackQuery):
         await callback.message.answer_document(
             FSInputFile(excel_path),
             caption=translations["excel_generated"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="stats")]
-            ]),
+            reply_markup=keyboards.back(action="stats", factory=None),
             protect_content=True
         )
         logger.info(f"Admin {callback.from_user.id} exported stats to {excel_path}")
@@ -711,9 +818,7 @@ async def export_stats_to_excel(callback: CallbackQuery):
         translations = get_translations()
         await callback.message.edit_text(
             translations["excel_error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="stats")]
-            ]),
+            reply_markup=keyboards.back(action="stats", factory=None),
             protect_content=True
         )
         logger.error(f"Error exporting stats to Excel for admin {callback.from_user.id}: {e}")
\ No newline at end of file
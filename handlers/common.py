@@ -4,12 +4,22 @@ import logging
 from aiogram import Router, F
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, Contact, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from config.settings import DB_PATH, ADMIN_ID, WELCOME_IMAGE, COIN_PENALTY
+from config.settings import ADMIN_ID, WELCOME_IMAGE, COIN_PENALTY, SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE
 from states.states import UserStates
-from callbacks.callbacks import TaskCB,ProblemCB
+from callbacks.callbacks import TaskCB,LanguageCB
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
 from config.settings import TIMEZONE
+from utils.timestamps import now_ts, format_ts, day_bounds, week_bounds, month_bounds
+from database.db import set_problem_photo_file_id, fetch_one, fetch_all, execute
+from cache.leaderboard import leaderboard
+from cache.profiles import get_profile, user_language
+from cache.events import user_changed
+from cache.panels import get_panel, store_panel, panel_epoch
+from utils.i18n import messages, variants
+from utils import keyboards
+from cache.catalog import catalog
+from database import ledger
 from aiogram.types import CallbackQuery
 import os
 # Configure logging
@@ -18,67 +28,30 @@ logger = logging.getLogger(__name__)
 
 common_router = Router()
 
-def get_translations():
-    return {
-        "welcome": "Iltimos, ismingizni kiriting:",
-        "welcome_no_image":"Iltimos, ismingizni kiriting:",
-        "enter_last_name": "Familyangizni kiriting:",
-        "enter_phone": "Telefon raqamingizni yuboring (raqam yoki kontakt sifatida):",
-        "invalid_input": "⚠️ Iltimos, to‘g‘ri ma’lumot kiriting!",
-        "registration_complete": "✅ Ro‘yxatdan o‘tdingiz!\n"
-                  "🎯 Salom! Har kuni yangi masalalar sizni kutmoqda!\n"
-                  "To‘g‘ri yechimlar uchun tanga olasiz, lekin vaqtida topshirmasangiz {penalty} tanga yo‘qotasiz! 💰\n"
-                  "Asosiy menyuni ko‘rish uchun /menu buyrug‘ini ishlating.",
-        "already_registered": "⚠️ Siz allaqachon ro‘yxatdan o‘tgansiz. /menu buyrug‘i bilan davom eting.",
-        "menu": "📋 Asosiy menyu:",
-        "coins": "💰 Sizning tangalaringiz: {coins}",
-        "history_empty": "📜 Hozircha masalalar yo‘q.",
-        "history": "Oxirgi masalalar:\n\n",
-        "leaderboard": "🏆 Eng yaxshi foydalanuvchilar:\n\n",
-        "progress": "📈 Sizning yutuqlaringiz:\n\n",
-        "error": "⚠️ Xatolik yuz berdi, qayta urinib ko‘ring.",
-        "panel": "🎮 Foydalanuvchi paneli:\n\n",
-        "today_tasks": "📅 Bugungi masalalar:\n",
-        "all_tasks": "📚 Barcha masalalar:\n\n",
-        "task_status_pending": "⏳ Kutmoqda",
-        "task_status_submitted": "📤 Yuborilgan",
-        "task_status_approved": "✅ Tasdiqlangan",
-        "task_status_rejected": "❌ Rad etilgan",
-        "task_status_missed": "⏰ O‘tkazib yuborilgan",
-        "cancel": "🔙 Orqaga"
-    }
-
-def get_main_menu():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🎮 Panel", callback_data=TaskCB(action="panel", problem_id=0).pack()),
-         InlineKeyboardButton(text="💰 Tangalar", callback_data=TaskCB(action="coins", problem_id=0).pack())],
-        [InlineKeyboardButton(text="📜 Tarix", callback_data=TaskCB(action="history", problem_id=0).pack()),
-         InlineKeyboardButton(text="🏆 Reyting", callback_data=TaskCB(action="leaderboard", problem_id=0).pack())],
-        [InlineKeyboardButton(text="📈 Yutuqlar", callback_data=TaskCB(action="progress", problem_id=0).pack())]
-        #  InlineKeyboardButton(text="📚 Masalalar", callback_data=TaskCB(action="tasks", problem_id=0).pack())]
-    ])
+def get_translations(language=DEFAULT_LANGUAGE):
+    return messages("common", language)
+
+def get_main_menu(language=DEFAULT_LANGUAGE):
+    return keyboards.main_menu(language)
 
 @common_router.message(CommandStart())
 async def start_handler(message: Message, state: FSMContext):
+    lang = await user_language(message.from_user.id, message.from_user.language_code)
     user_id = message.from_user.id
-    translations = get_translations()
+    translations = get_translations(lang)
     logger.info(f"User {user_id} started registration")
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM users WHERE user_id=?", (user_id,))
-        if cursor.fetchone()[0] > 0:
-            await message.answer(translations["already_registered"], reply_markup=get_main_menu(), protect_content=True)
-            await state.clear()
-            logger.info(f"User {user_id} already registered")
-            return
+        registered = await get_profile(user_id)
     except sqlite3.Error as e:
         logger.error(f"Database error in start_handler for user {user_id}: {e}")
         await message.answer(translations["error"], protect_content=True)
         return
-    finally:
-        conn.close()
+    if registered:
+        await message.answer(translations["already_registered"], reply_markup=keyboards.main_menu(lang), protect_content=True)
+        await state.clear()
+        logger.info(f"User {user_id} already registered")
+        return
 
     if user_id == ADMIN_ID:
         await message.answer("👑 Admin panelga xush kelibsiz!\n/admin - boshqaruv menyusi", protect_content=True)
@@ -104,8 +77,9 @@ async def start_handler(message: Message, state: FSMContext):
 
 @common_router.message(UserStates.waiting_for_first_name, F.text)
 async def receive_first_name(message: Message, state: FSMContext):
+    lang = await user_language(message.from_user.id, message.from_user.language_code)
     first_name = message.text.strip()
-    translations = get_translations()
+    translations = get_translations(lang)
     if not first_name or len(first_name) < 2:
         await message.answer(translations["invalid_input"], protect_content=True)
         logger.warning(f"User {message.from_user.id} entered invalid first name: {first_name}")
@@ -117,8 +91,9 @@ async def receive_first_name(message: Message, state: FSMContext):
 
 @common_router.message(UserStates.waiting_for_last_name, F.text)
 async def receive_last_name(message: Message, state: FSMContext):
+    lang = await user_language(message.from_user.id, message.from_user.language_code)
     last_name = message.text.strip()
-    translations = get_translations()
+    translations = get_translations(lang)
     if not last_name or len(last_name) < 2:
         await message.answer(translations["invalid_input"], protect_content=True)
         logger.warning(f"User {message.from_user.id} entered invalid last name: {last_name}")
@@ -126,7 +101,7 @@ async def receive_last_name(message: Message, state: FSMContext):
     await state.update_data(last_name=last_name)
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="📞 Kontakt yuborish", request_contact=True)],
+            [KeyboardButton(text=translations["btn_contact"], request_contact=True)],
             [KeyboardButton(text=translations["cancel"])]
         ],
         resize_keyboard=True,
@@ -140,16 +115,17 @@ async def receive_last_name(message: Message, state: FSMContext):
 # async def receive_phone(message: Message, state: FSMContext):
 from aiogram.filters import or_f
 
-@common_router.message(UserStates.waiting_for_phone, or_f(F.contact, F.text.regexp(r"^\+?\d{9,12}$"), F.text == get_translations()["cancel"]))
+@common_router.message(UserStates.waiting_for_phone, or_f(F.contact, F.text.regexp(r"^\+?\d{9,12}$"), F.text.in_(variants("common", "cancel"))))
 async def receive_phone(message: Message, state: FSMContext):
+    lang = await user_language(message.from_user.id, message.from_user.language_code)
 
-    translations = get_translations()
+    translations = get_translations(lang)
     user_id = message.from_user.id
 
-    if message.text == translations["cancel"]:
+    if message.text in variants("common", "cancel"):
         await message.answer(
             translations["menu"],
-            reply_markup=get_main_menu(),
+            reply_markup=keyboards.main_menu(lang),
             protect_content=True
         )
         await state.clear()
@@ -172,16 +148,15 @@ async def receive_phone(message: Message, state: FSMContext):
         return
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (user_id, first_name, last_name, phone_number, coins, language) VALUES (?, ?, ?, ?, 0, 'uz')",
-            (user_id, first_name, last_name, phone_number)
+        await execute(
+            "INSERT INTO users (user_id, first_name, last_name, phone_number, coins, language) VALUES (?, ?, ?, ?, 0, ?)",
+            (user_id, first_name, last_name, phone_number, lang)
         )
-        conn.commit()
+        user_changed(user_id)
+        leaderboard.update(user_id, 0, f"{first_name} {last_name}")
         await message.answer(
             translations["registration_complete"],
-            reply_markup=get_main_menu(),
+            reply_markup=keyboards.main_menu(lang),
             protect_content=True
         )
         logger.info(f"User {user_id} registered successfully: {first_name} {last_name}, {phone_number}")
@@ -193,271 +168,231 @@ async def receive_phone(message: Message, state: FSMContext):
         )
         logger.error(f"Database error during registration for user {user_id}: {e}")
     finally:
-        conn.close()
         await state.clear()
 
 @common_router.message(Command("menu"))
 async def show_menu(message: Message):
-    translations = get_translations()
-    await message.answer(translations["menu"], reply_markup=get_main_menu(), protect_content=True)
+    lang = await user_language(message.from_user.id, message.from_user.language_code)
+    translations = get_translations(lang)
+    await message.answer(translations["menu"], reply_markup=keyboards.main_menu(lang), protect_content=True)
     logger.info(f"User {message.from_user.id} accessed main menu")
 
 @common_router.callback_query(TaskCB.filter(F.action == "coins"))
 async def show_coins(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     user_id = callback.from_user.id
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT coins FROM users WHERE user_id=?", (user_id,))
-        coins = cursor.fetchone()[0]
-        translations = get_translations()
+        coins = (await get_profile(user_id)).coins
+        translations = get_translations(lang)
         await callback.message.edit_text(
             translations["coins"].format(coins=coins),
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.info(f"User {user_id} viewed coins: {coins}")
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.error(f"Database error in show_coins for user {user_id}: {e}")
-    finally:
-        conn.close()
 
 @common_router.callback_query(TaskCB.filter(F.action == "history"))
 async def show_history(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, text, difficulty, category, deadline FROM problems ORDER BY created_at DESC LIMIT 5")
-        problems = cursor.fetchall()
-        translations = get_translations()
+        problems = catalog.latest(5)
+        translations = get_translations(lang)
         if not problems:
             await callback.message.edit_text(
                 translations["history_empty"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-                ]),
+                reply_markup=keyboards.back(lang),
                 protect_content=True
             )
             logger.info(f"User {callback.from_user.id} viewed history: no problems found")
             return
 
         text = translations["history"]
-        for pid, ptext, diff, cat, deadline in problems:
-            text += f"📘 Masala #{pid} ({cat} - {diff})\n{ptext}\nDeadline: {deadline}n\n"
+        for p in problems:
+            title = translations["problem_title"].format(id=p.id, category=p.category, difficulty=p.difficulty)
+            text += f"{title}\n{p.text}\nDeadline: {format_ts(p.deadline_ts)}n\n"
         await callback.message.edit_text(
             text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.info(f"User {callback.from_user.id} viewed history")
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.error(f"Database error in show_history for user {callback.from_user.id}: {e}")
-    finally:
-        conn.close()
 
 @common_router.callback_query(TaskCB.filter(F.action == "leaderboard"))
 async def show_leaderboard(callback: CallbackQuery):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT first_name, last_name, coins FROM users ORDER BY coins DESC LIMIT 5")
-        leaders = cursor.fetchall()
-        translations = get_translations()
-        if not leaders:
-            await callback.message.edit_text(
-                translations["history_empty"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-                ]),
-                protect_content=True
-            )
-            logger.info(f"User {callback.from_user.id} viewed leaderboard: no leaders found")
-            return
-
-        text = translations["leaderboard"]
-        for i, (first_name, last_name, coins) in enumerate(leaders, 1):
-            text += f"{i}. {first_name} {last_name} - {coins} 💰\n"
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
+    # Served from the in-memory ranked index; no database query on this path
+    user_id = callback.from_user.id
+    translations = get_translations(lang)
+    back_keyboard = keyboards.back(lang)
+    leaders = leaderboard.top(5)
+    if not leaders:
         await callback.message.edit_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            translations["history_empty"],
+            reply_markup=back_keyboard,
             protect_content=True
         )
-        logger.info(f"User {callback.from_user.id} viewed leaderboard")
+        logger.info(f"User {user_id} viewed leaderboard: no leaders found")
+        return
+
+    text = translations["leaderboard"]
+    for rank, _, name, coins in leaders:
+        text += f"{rank}. {name} - {coins} 💰\n"
+    rank = leaderboard.rank(user_id)
+    if rank is not None and rank > len(leaders):
+        text += translations["leaderboard_position"].format(rank=rank, total=len(leaderboard))
+        for neighbour_rank, _, name, coins in leaderboard.neighbours(user_id):
+            marker = "👉 " if neighbour_rank == rank else ""
+            text += f"{marker}{neighbour_rank}. {name} - {coins} 💰\n"
+    await callback.message.edit_text(
+        text,
+        reply_markup=back_keyboard,
+        protect_content=True
+    )
+    logger.info(f"User {user_id} viewed leaderboard")
+
+@common_router.callback_query(TaskCB.filter(F.action.in_({"top_week", "top_month"})))
+async def show_window_leaderboard(callback: CallbackQuery, callback_data: TaskCB):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
+    # Sums a week's or month's worth of per-day buckets instead of scanning the ledger
+    user_id = callback.from_user.id
+    translations = get_translations(lang)
+    bounds = week_bounds if callback_data.action == "top_week" else month_bounds
+    start, end = bounds(datetime.now(TIMEZONE).date())
+    back_keyboard = keyboards.back(lang)
+    try:
+        leaders = await ledger.window_leaders(start, end, 10)
+        earned = await ledger.window_earned(user_id, start, end)
+        if not leaders:
+            text = translations["history_empty"]
+        else:
+            text = translations[callback_data.action]
+            for rank, (_, first_name, last_name, coins) in enumerate(leaders, 1):
+                text += f"{rank}. {first_name} {last_name} - {coins} 💰\n"
+            text += translations["window_earned"].format(coins=earned)
+        await callback.message.edit_text(text, reply_markup=back_keyboard, protect_content=True)
+        logger.info(f"User {user_id} viewed {callback_data.action} leaderboard")
     except sqlite3.Error as e:
-        await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
-            protect_content=True
-        )
-        logger.error(f"Database error in show_leaderboard for user {callback.from_user.id}: {e}")
-    finally:
-        conn.close()
+        await callback.message.edit_text(translations["error"], reply_markup=back_keyboard, protect_content=True)
+        logger.error(f"Database error in show_window_leaderboard for user {user_id}: {e}")
 
 @common_router.callback_query(TaskCB.filter(F.action == "progress"))
 async def show_progress(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT status, COUNT(*) FROM submissions 
-            WHERE user_id=? GROUP BY status
-        """, (callback.from_user.id,))
-        stats = {s: c for s, c in cursor.fetchall()}
-        cursor.execute("SELECT coins FROM users WHERE user_id=?", (callback.from_user.id,))
-        coins = cursor.fetchone()[0]
+        profile = await get_profile(callback.from_user.id)
+        stats, coins = profile.statuses, profile.coins
         
-        translations = get_translations()
+        translations = get_translations(lang)
         text = translations["progress"]
-        text += f"✅ Tasdiqlangan: {stats.get('approved', 0)}\n"
-        text += f"❌ Rad etilgan: {stats.get('rejected', 0)}\n"
-        text += f"⏳ Kutmoqda: {stats.get('pending', 0)}\n"
-        text += f"💰 Jami tangalar: {coins}"
+        text += translations["progress_approved"].format(count=stats.get('approved', 0))
+        text += translations["progress_rejected"].format(count=stats.get('rejected', 0))
+        text += translations["progress_pending"].format(count=stats.get('pending', 0))
+        text += translations["progress_coins"].format(coins=coins)
         await callback.message.edit_text(
             text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.info(f"User {callback.from_user.id} viewed progress")
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.error(f"Database error in show_progress for user {callback.from_user.id}: {e}")
-    finally:
-        conn.close()
 
 @common_router.callback_query(TaskCB.filter(F.action == "panel"))
 async def show_panel(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     user_id = callback.from_user.id
-    today = datetime.now(TIMEZONE).date()
+    now = now_ts()
+    today_start, today_end = day_bounds(datetime.now(TIMEZONE).date())
+    # Repeat clicks are answered from the render cache until this user's data or the problem set changes
+    text = get_panel(user_id, lang, today_start)
+    if text is not None:
+        await callback.message.edit_text(text, reply_markup=keyboards.panel(lang), protect_content=True)
+        logger.info(f"User {user_id} viewed panel (cached)")
+        return
+    epoch = panel_epoch()
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
         # Today's tasks
-        cursor.execute("""
-            SELECT p.id, p.text, p.difficulty, p.category, p.deadline, s.status
+        today_tasks = await fetch_all("""
+            SELECT p.id, p.text, p.difficulty, p.category, p.deadline_ts, s.status
             FROM problems p
             LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
-            WHERE date(p.scheduled_at) = ?
-        """, (user_id, today.strftime("%Y-%m-%d")))
-        today_tasks = cursor.fetchall()
+            WHERE p.scheduled_ts >= ? AND p.scheduled_ts < ?
+        """, (user_id, today_start, today_end))
         
         # All tasks
-        cursor.execute("""
-            SELECT p.id, p.text, p.difficulty, p.category, p.deadline, s.status
+        all_tasks = await fetch_all("""
+            SELECT p.id, p.text, p.difficulty, p.category, p.deadline_ts, s.status
             FROM problems p
             LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
             ORDER BY p.created_at DESC LIMIT 5
         """, (user_id,))
-        all_tasks = cursor.fetchall()
-        
-        conn.close()
 
-        translations = get_translations()
+        translations = get_translations(lang)
         text = translations["panel"]
         
         # Today's tasks
         text += translations["today_tasks"]
         if not today_tasks:
-            text += "📪 Bugun uchun masalalar yo‘q.\n\n"
+            text += translations["no_today_tasks"]
         else:
             for pid, ptext, diff, cat, deadline, status in today_tasks:
                 status_text = translations[f"task_status_{status or 'pending'}"]
-                text += f"📘 Masala #{pid} ({cat} - {diff}): {status_text}\n"
+                text += translations["problem_title"].format(id=pid, category=cat, difficulty=diff) + f": {status_text}\n"
                 text += f"{ptext[:50]}...n"
-                text += f"Deadline: {deadline}n\n"
+                text += f"Deadline: {format_ts(deadline)}n\n"
         
         # All tasks
         text += translations["all_tasks"]
         for pid, ptext, diff, cat, deadline, status in all_tasks:
-            status_text = translations[f"task_status_{status or ('missed' if datetime.strptime(deadline, '%Y-%m-%d %H:%M:%S').replace(tzinfo=TIMEZONE) < datetime.now(TIMEZONE) else 'pending')}"]
-            text += f"📘 Masala #{pid} ({cat} - {diff}): {status_text}\n"
+            status_text = translations[f"task_status_{status or ('missed' if deadline is not None and deadline < now else 'pending')}"]
+            text += translations["problem_title"].format(id=pid, category=cat, difficulty=diff) + f": {status_text}\n"
             text += f"{ptext[:50]}...n\n"
         
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text="📘 Bugungi masalalar",
-                callback_data=TaskCB(action="today_tasks", problem_id=0).pack()
-            )],
-            [InlineKeyboardButton(
-                text="📚 Barcha masalalar",
-                callback_data=TaskCB(action="all_tasks", problem_id=0).pack()
-            )],
-            [InlineKeyboardButton(
-                text="🔙 Orqaga",
-                callback_data=TaskCB(action="menu", problem_id=0).pack()
-            )]
-        ])
-        await callback.message.edit_text(text, reply_markup=keyboard, protect_content=True)
+        store_panel(user_id, lang, today_start, text, epoch)
+        await callback.message.edit_text(text, reply_markup=keyboards.panel(lang), protect_content=True)
         logger.info(f"User {user_id} viewed panel")
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="menu", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang),
             protect_content=True
         )
         logger.error(f"Database error in show_panel for user {user_id}: {e}")
 
 @common_router.callback_query(TaskCB.filter(F.action == "today_tasks"))
 async def show_today_tasks(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     user_id = callback.from_user.id
-    now = datetime.now(TIMEZONE)
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
         # Faqat deadline hali tugamagan masalalarni olish
-        cursor.execute("""
-            SELECT p.id, p.text, p.difficulty, p.category, p.deadline, s.status
-            FROM problems p
-            LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
-            WHERE p.deadline > ?
-            ORDER BY p.scheduled_at ASC
-        """, (user_id, now.strftime("%Y-%m-%d %H:%M:%S")))
-
-        tasks = cursor.fetchall()
-        conn.close()
+        tasks = catalog.active(now_ts())
 
-        translations = get_translations()
+        translations = get_translations(lang)
 
         if not tasks:
             await callback.message.edit_text(
-                "📭 Bugungi faol masalalar yo‘q (deadline tugagan yoki hali boshlanmagan).",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-                ]),
+                translations["no_active_tasks"],
+                reply_markup=keyboards.back(lang, "panel"),
                 protect_content=True
             )
             logger.info(f"User {user_id} — no active tasks found.")
@@ -465,13 +400,13 @@ async def show_today_tasks(callback: CallbackQuery):
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(
-                text=f"#{pid} Tugash vaqti({deadline})",
-                callback_data=TaskCB(action="view_task", problem_id=pid).pack()
-            )] for pid, _, diff, cat, deadline, _ in tasks
-        ] + [[InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]])
+                text=translations["active_task_button"].format(id=p.id, deadline=format_ts(p.deadline_ts)),
+                callback_data=TaskCB(action="view_task", problem_id=p.id).pack()
+            )] for p in tasks
+        ] + keyboards.back(lang, "panel").inline_keyboard)
 
         await callback.message.edit_text(
-            "📅 Hali tugamagan bugungi masalalar:",
+            translations["active_tasks"],
             reply_markup=keyboard,
             protect_content=True
         )
@@ -480,36 +415,24 @@ async def show_today_tasks(callback: CallbackQuery):
 
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            "❌ Ma'lumotlar bazasida xatolik yuz berdi.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["db_error"],
+            reply_markup=keyboards.back(lang, "panel"),
             protect_content=True
         )
         logger.error(f"Database error in show_today_tasks for user {user_id}: {e}")
 
 @common_router.callback_query(TaskCB.filter(F.action == "all_tasks"))
 async def show_all_tasks(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     user_id = callback.from_user.id
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.id, p.text, p.difficulty, p.category, p.deadline, s.status
-            FROM problems p
-            LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
-            ORDER BY p.created_at DESC LIMIT 5
-        """, (user_id,))
-        tasks = cursor.fetchall()
-        conn.close()
+        tasks = catalog.latest(5)
 
-        translations = get_translations()
+        translations = get_translations(lang)
         if not tasks:
             await callback.message.edit_text(
                 translations["history_empty"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-                ]),
+                reply_markup=keyboards.back(lang, "panel"),
                 protect_content=True
             )
             logger.info(f"User {user_id} viewed all tasks: no tasks found")
@@ -517,101 +440,108 @@ async def show_all_tasks(callback: CallbackQuery):
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(
-                text=f"#{pid} Tugash vaqti({deadline})",
-                callback_data=TaskCB(action="view_task", problem_id=pid).pack()
-            )] for pid, _, diff, cat, deadline, _ in tasks
-        ] + [[InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]])
+                text=translations["active_task_button"].format(id=p.id, deadline=format_ts(p.deadline_ts)),
+                callback_data=TaskCB(action="view_task", problem_id=p.id).pack()
+            )] for p in tasks
+        ] + keyboards.back(lang, "panel").inline_keyboard)
         await callback.message.edit_text(translations["all_tasks"], reply_markup=keyboard, protect_content=True)
         logger.info(f"User {user_id} viewed all tasks")
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang, "panel"),
             protect_content=True
         )
         logger.error(f"Database error in show_all_tasks for user {user_id}: {e}")
 
 @common_router.callback_query(TaskCB.filter(F.action == "view_task"))
 async def view_task(callback: CallbackQuery, callback_data: TaskCB):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     user_id = callback.from_user.id
     problem_id = callback_data.problem_id
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT p.text, p.image_path, p.difficulty, p.category, p.deadline, s.status
-            FROM problems p
-            LEFT JOIN submissions s ON p.id = s.problem_id AND s.user_id=?
-            WHERE p.id=?
-        """, (user_id, problem_id))
-        task = cursor.fetchone()
-        conn.close()
+        task = catalog.get(problem_id)
 
-        translations = get_translations()
+        translations = get_translations(lang)
         if not task:
             await callback.message.edit_text(
                 translations["error"],
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-                ]),
+                reply_markup=keyboards.back(lang, "panel"),
                 protect_content=True
             )
             logger.warning(f"User {user_id} tried to view non-existent task #{problem_id}")
             return
 
-        text, image_path, diff, cat, deadline, status = task
-        status_text = translations[f"task_status_{status or ('missed' if datetime.strptime(deadline, '%Y-%m-%d %H:%M:%S').replace(tzinfo=TIMEZONE) < datetime.now(TIMEZONE) else 'pending')}"]
+        _, text, image_path, diff, cat, deadline, _, photo_file_id = task
+        # The problem comes from the catalog; only the user's own status needs the (unique) index
+        row = await fetch_one("SELECT status FROM submissions WHERE user_id=? AND problem_id=?", (user_id, problem_id))
+        status = row[0] if row else None
+        now = now_ts()
+        status_text = translations[f"task_status_{status or ('missed' if deadline is not None and deadline < now else 'pending')}"]
         message_text = (
-            f"📘 Masala #{problem_id} ({cat} - {diff}):\n\n"
-            f"{text}\n\nDeadline: {deadline}n"
+            f"{translations['problem_title'].format(id=problem_id, category=cat, difficulty=diff)}:\n\n"
+            f"{text}\n\nDeadline: {format_ts(deadline)}n"
             f"Status: {status_text}"
         )
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-        ])
-        if not status and datetime.strptime(deadline, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TIMEZONE) > datetime.now(TIMEZONE):
-            keyboard.inline_keyboard.insert(0, [
-                InlineKeyboardButton(
-                    text="✅ Yechim yuborish",
-                    callback_data=ProblemCB(action="submit", problem_id=problem_id).pack()
-                )
-            ])
+        keyboard = keyboards.task(problem_id, not status and deadline is not None and deadline > now, lang)
 
-        if image_path and os.path.exists(image_path):
+        if photo_file_id or (image_path and os.path.exists(image_path)):
             await callback.message.delete()
-            await callback.message.answer_photo(
-                FSInputFile(image_path),
+            sent = await callback.message.answer_photo(
+                photo_file_id or FSInputFile(image_path),
                 caption=message_text,
                 reply_markup=keyboard,
                 protect_content=True
             )
+            if not photo_file_id:
+                await set_problem_photo_file_id(problem_id, sent.photo[-1].file_id)
+                catalog.update(problem_id, photo_file_id=sent.photo[-1].file_id)
             logger.info(f"User {user_id} viewed task #{problem_id} with image")
         else:
             await callback.message.edit_text(message_text, reply_markup=keyboard, protect_content=True)
             logger.info(f"User {user_id} viewed task #{problem_id} without image")
     except sqlite3.Error as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang, "panel"),
             protect_content=True
         )
         logger.error(f"Database error in view_task for user {user_id}, task #{problem_id}: {e}")
     except Exception as e:
         await callback.message.edit_text(
-            get_translations()["error"],
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=TaskCB(action="panel", problem_id=0).pack())]
-            ]),
+            get_translations(lang)["error"],
+            reply_markup=keyboards.back(lang, "panel"),
             protect_content=True
         )
         logger.error(f"Unexpected error in view_task for user {user_id}, task #{problem_id}: {e}")
 
 @common_router.callback_query(TaskCB.filter(F.action == "menu"))
 async def show_menu_callback(callback: CallbackQuery):
-    translations = get_translations()
-    await callback.message.edit_text(translations["menu"], reply_markup=get_main_menu(), protect_content=True)
-    logger.info(f"User {callback.from_user.id} returned to main menu")
\ No newline at end of file
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
+    translations = get_translations(lang)
+    await callback.message.edit_text(translations["menu"], reply_markup=keyboards.main_menu(lang), protect_content=True)
+    logger.info(f"User {callback.from_user.id} returned to main menu")
+@common_router.callback_query(TaskCB.filter(F.action == "language"))
+async def choose_language(callback: CallbackQuery):
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
+    translations = get_translations(lang)
+    await callback.message.edit_text(translations["select_language"], reply_markup=keyboards.languages(lang), protect_content=True)
+
+@common_router.callback_query(LanguageCB.filter())
+async def set_language(callback: CallbackQuery, callback_data: LanguageCB):
+    user_id = callback.from_user.id
+    lang = callback_data.lang if callback_data.lang in SUPPORTED_LANGUAGES else DEFAULT_LANGUAGE
+    try:
+        await execute("UPDATE users SET language=? WHERE user_id=?", (lang, user_id))
+        user_changed(user_id)
+    except sqlite3.Error as e:
+        await callback.message.edit_text(get_translations(lang)["error"], protect_content=True)
+        logger.error(f"Database error in set_language for user {user_id}: {e}")
+        return
+    translations = get_translations(lang)
+    await callback.message.edit_text(
+        f"{translations['language_set']}\n\n{translations['menu']}",
+        reply_markup=keyboards.main_menu(lang),
+        protect_content=True
+    )
+    logger.info(f"User {user_id} switched language to {lang}")
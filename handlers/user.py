@@ -1,15 +1,23 @@
-import os
 import sqlite3
-from datetime import datetime
 from aiogram import Router, Bot, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from config.settings import DB_PATH, SUBMISSIONS_DIR, BOT_TOKEN, ADMIN_ID
+from config.settings import BOT_TOKEN, DEFAULT_LANGUAGE, SUBMISSION_ARCHIVE, IMAGE_NORMALIZE, MEDIA_MAX_BYTES
+from utils.timestamps import format_ts
+from database.db import fetch_one, execute, missing_unique
+from cache.profiles import get_profile, user_language
+from cache.events import user_changed
+from scheduler.archive import schedule_processing
+from scheduler.review import send_for_review
+from utils.media import too_large
+from utils.i18n import messages
+from utils import keyboards
+from cache.catalog import catalog
 from states.states import UserStates
-from callbacks.callbacks import ProblemCB, SubmissionCB, CategoryCB
+from callbacks.callbacks import ProblemCB, CategoryCB
 
 # --- Router va bot
 user_router = Router()
@@ -22,203 +30,147 @@ bot = Bot(
 )
 
 # --- Tarjimalar
-def get_translations():
-    return {
-        "submit_prompt": "📸 Yechimingiz rasmini yuboring:",
-        "already_submitted": "⚠️ Siz bu masalaga allaqachon yechim yuborgansiz!",
-        "submission_accepted": "✅ Yechimingiz qabul qilindi! Admin tekshiradi.",
-        "submission_error": "⚠️ Yechimni saqlashda xatolik yuz berdi.",
-        "approved": "🎉 Yechimingiz tasdiqlandi! +{coins} tanga qo‘shildi.\n💰 Joriy balans: {total_coins}",
-        "rejected": "❌ Yechimingiz rad etildi.\nSabab: {feedback}\n💰 Joriy balans: {coins}",
-        "tasks": "📚 Masala kategoriyasini tanlang:",
-        "no_tasks": "📜 Ushbu kategoriyada masalalar yo‘q.",
-        "error": "⚠️ Xatolik yuz berdi, qaytadan urinib ko‘ring.",
-        "history": "📋 So‘nggi masalalar:\n\n"
-    }
+def get_translations(language=DEFAULT_LANGUAGE):
+    return messages("user", language)
 
 # --- Masalaga yechim yuborish bosqichi
 @user_router.callback_query(ProblemCB.filter(F.action == "submit"))
 async def user_submit_start(callback: CallbackQuery, callback_data: ProblemCB, state: FSMContext):
-    user_id = callback.from_user.id
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
     problem_id = callback_data.problem_id
-    translations = get_translations()
+    translations = get_translations(lang)
 
+    # Registration comes from the cached profile; only a cold cache touches the DB
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT COUNT(*) FROM submissions WHERE user_id=? AND problem_id=?",
-            (user_id, problem_id)
-        )
-        already_sent = cursor.fetchone()[0] > 0
-    finally:
-        conn.close()
-
-    if already_sent:
-        await callback.message.edit_text(
-            translations["already_submitted"],
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=ProblemCB(action="panel", problem_id=0).pack())]
-                ]
-            ),
-        )
+        profile = await get_profile(callback.from_user.id)
+    except sqlite3.Error as e:
+        print("DB xato:", e)
+        await callback.message.edit_text(translations["error"])
+        return
+    if profile is None:
+        await callback.message.edit_text(translations["not_registered"])
         return
 
+    # Duplicates are rejected by the unique (user_id, problem_id) index when the photo arrives
     await state.update_data(problem_id=problem_id)
     await callback.message.edit_text(
         translations["submit_prompt"],
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=ProblemCB(action="panel", problem_id=0).pack())]
-            ]
-        ),
+        reply_markup=keyboards.back(lang, "panel", ProblemCB),
     )
     await state.set_state(UserStates.waiting_for_photo)
 
 # --- Foydalanuvchi rasm yuborganida
 @user_router.message(UserStates.waiting_for_photo, F.photo | F.document)
 async def receive_photo(message: Message, state: FSMContext):
-    translations = get_translations()
+    lang = await user_language(message.from_user.id, message.from_user.language_code)
+    translations = get_translations(lang)
     data = await state.get_data()
     problem_id = data.get("problem_id")
     user_id = message.from_user.id
 
     # 1. Fayl id ni aniqlash
     if message.photo:
-        file_id = message.photo[-1].file_id
+        file = message.photo[-1]
+        file_kind = "photo"
     elif message.document:
-        file_id = message.document.file_id
+        file = message.document
+        file_kind = "document"
     else:
-        await message.answer("❌ Faqat rasm yuboring.")
+        await message.answer(translations["photo_only"])
         return
+    file_id = file.file_id
 
-    # 2. Faylni saqlash uchun joy yaratamiz
-    os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
-    file = await bot.get_file(file_id)
-    file_path = os.path.join(
-        SUBMISSIONS_DIR,
-        f"{user_id}_{problem_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-    )
-    await bot.download_file(file.file_path, file_path)
+    # 2. Hajmni tekshirish (Telegram file_size ni oldindan beradi)
+    if too_large(file.file_size):
+        await message.answer(translations["file_too_large"].format(mb=MEDIA_MAX_BYTES // (1024 * 1024)))
+        return
 
-    # 3. Bazaga yozish
+    # 3. Bazaga yozish (unique index claims the slot before anything is sent)
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO submissions (user_id, problem_id, photo_path) VALUES (?, ?, ?)",
-            (user_id, problem_id, file_path)
+        if "ux_submissions_user_problem" in missing_unique:
+            # Without the unique index the INSERT would accept a second submission
+            row = await fetch_one(
+                "SELECT COUNT(*) FROM submissions WHERE user_id=? AND problem_id=?",
+                (user_id, problem_id)
+            )
+            if row[0]:
+                raise sqlite3.IntegrityError("submission already exists")
+        cursor = await execute(
+            # photo_path is filled in by the archiver once the file is in the media store
+            "INSERT INTO submissions (user_id, problem_id, photo_path, file_id, file_kind) VALUES (?, ?, '', ?, ?)",
+            (user_id, problem_id, file_id, file_kind)
         )
         submission_id = cursor.lastrowid
-        conn.commit()
+        user_changed(user_id)
+    except sqlite3.IntegrityError:
+        await state.clear()
+        await message.answer(
+            translations["already_submitted"],
+            reply_markup=keyboards.back(lang, "panel", ProblemCB),
+        )
+        return
     except sqlite3.Error as e:
         print("DB xato:", e)
         await message.answer(translations["submission_error"])
         return
-    finally:
-        conn.close()
 
-    # 4. Holatni tozalash
+    # 4. Admin’ga yuborish: Telegram faylni file_id orqali qayta ishlatadi, yuklab olish shart emas.
+    # Fon bosqichi yoqilgan bo‘lsa, rasm avval xeshlanadi, nusxalar belgilanadi va keyin yuboriladi
+    # (hujjatlar, ko‘pincha katta PNG, siqilgan nusxa sifatida)
+    deferred = SUBMISSION_ARCHIVE and IMAGE_NORMALIZE
+    if not deferred:
+        try:
+            await send_for_review(bot, submission_id, user_id, problem_id, file_id, file_kind)
+        except Exception as e:
+            print("Admin’ga yuborishda xato:", e)
+            await execute("DELETE FROM submissions WHERE id=?", (submission_id,))
+            user_changed(user_id)
+            await message.answer(translations["submission_error"])
+            return
+
+    # 5. Holatni tozalash
     await state.clear()
 
-    # 5. Foydalanuvchiga xabar
+    # 6. Foydalanuvchiga xabar
     await message.answer(
         translations["submission_accepted"],
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data=ProblemCB(action="panel", problem_id=0).pack())]
-            ]
-        ),
+        reply_markup=keyboards.back(lang, "panel", ProblemCB),
     )
 
-    # 6. Admin’ga yuborish
-    photo_to_send = FSInputFile(file_path)
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="✅ Ishladi",
-                    callback_data=SubmissionCB(action="approve", submission_id=submission_id).pack()
-                ),
-                InlineKeyboardButton(
-                    text="❌ Ishlamadi",
-                    callback_data=SubmissionCB(action="reject", submission_id=submission_id).pack()
-                )
-            ]
-        ]
-    )
-
-    await bot.send_photo(
-        ADMIN_ID,
-        photo_to_send,
-        caption=f"🆔 Submission #{submission_id}\n👤 User: {user_id}\n📘 Problem #{problem_id}",
-        reply_markup=keyboard,
-        protect_content=True
-    )
+    # 7. Lokal nusxa, siqish, nusxalarni tekshirish va admin’ga yuborish fon rejimida
+    if SUBMISSION_ARCHIVE:
+        schedule_processing(bot, submission_id)
 
 
 # --- Kategoriyalarni ko‘rsatish
 @user_router.callback_query(ProblemCB.filter(F.action == "tasks"))
 async def show_tasks(callback: CallbackQuery):
-    translations = get_translations()
-    try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT category FROM problems")
-        categories = [row[0] for row in cursor.fetchall()]
-        conn.close()
-    except sqlite3.Error:
-        await callback.message.edit_text(translations["error"])
-        return
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
+    translations = get_translations(lang)
+    categories = catalog.categories()
 
     if not categories:
         await callback.message.edit_text(translations["no_tasks"])
         return
 
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=cat, callback_data=CategoryCB(category=cat).pack())]
-            for cat in categories
-        ] + [
-            [InlineKeyboardButton(text="🔙 Orqaga", callback_data=ProblemCB(action="menu", problem_id=0).pack())]
-        ]
-    )
-
-    await callback.message.edit_text(translations["tasks"], reply_markup=keyboard)
+    await callback.message.edit_text(translations["tasks"], reply_markup=keyboards.categories(categories, lang))
 
 
 # --- Har bir kategoriya ichidagi masalalar
 @user_router.callback_query(CategoryCB.filter())
 async def show_category_tasks(callback: CallbackQuery, callback_data: CategoryCB):
-    translations = get_translations()
+    lang = await user_language(callback.from_user.id, callback.from_user.language_code)
+    translations = get_translations(lang)
     category = callback_data.category
-
-    try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, text, difficulty, deadline FROM problems WHERE category=? ORDER BY created_at DESC LIMIT 5",
-            (category,)
-        )
-        problems = cursor.fetchall()
-        conn.close()
-    except sqlite3.Error:
-        await callback.message.edit_text(translations["error"])
-        return
+    problems = catalog.latest(5, category)
 
     if not problems:
         await callback.message.edit_text(translations["no_tasks"])
         return
 
     text = translations["history"]
-    for pid, ptext, diff, deadline in problems:
-        text += f"📘 Masala #{pid} ({category} - {diff})\n{ptext}\n<i>Deadline: {deadline}\n\n"
-
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Orqaga", callback_data=ProblemCB(action="tasks", problem_id=0).pack())]
-        ]
-    )
+    for p in problems:
+        title = messages("common", lang)["problem_title"].format(id=p.id, category=category, difficulty=p.difficulty)
+        text += f"{title}\n{p.text}\n<i>Deadline: {format_ts(p.deadline_ts)}\n\n"
 
-    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.message.edit_text(text, reply_markup=keyboards.back(lang, "tasks", ProblemCB))
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from config.settings import ARCHIVE_CONCURRENCY, IMAGE_NORMALIZE
+from database.db import fetch_one, fetch_all, execute
+from utils.timestamps import now_ts
+from utils.media import store_telegram_file, FileTooLarge
+from scheduler.imaging import normalize
+from scheduler.review import send_for_review
+from cache.phashes import find_duplicate, to_db
+
+logger = logging.getLogger(__name__)
+
+# Submissions are processed off the request path in stages: archive (download into the media store),
+# normalize (re-encode, thumbnail and perceptual hash on the process pool, then a near-duplicate
+# lookup) and notify the reviewer, flagging likely copies; reviewers get the thumbnail first and the
+# full file on request. Each stage stamps its own column, so a retry resumes where it stopped.
+# The semaphore bounds concurrent downloads and the task set keeps fire-and-forget tasks referenced;
+# _in_flight holds the submissions being processed, so the sweep never runs one twice in parallel
+_slots = asyncio.Semaphore(ARCHIVE_CONCURRENCY)
+_tasks = set()
+_in_flight = set()
+
+
+async def _archive(sender, submission_id, file_id):
+    async with _slots:
+        try:
+            file_path = await store_telegram_file(sender, file_id)
+        except FileTooLarge as e:
+            # Never retried: mark it archived without a local copy
+            logger.warning(f"Submission #{submission_id} not archived: {e}")
+            file_path = ""
+        except Exception as e:
+            # The row stays unarchived, so the periodic sweep retries it
+            logger.error(f"Archiving submission #{submission_id} failed: {e}")
+            return None
+    await execute("UPDATE submissions SET photo_path=?, archived_at=? WHERE id=?",
+        (file_path, now_ts(), submission_id))
+    return file_path
+
+
+async def release_blob(path):
+    # Blobs are shared between identical uploads, so one is deleted only when nothing refers to it
+    if await fetch_one("SELECT 1 FROM submissions WHERE photo_path=? OR thumb_path=? LIMIT 1", (path, path)):
+        return
+    if await fetch_one("SELECT 1 FROM problems WHERE image_path=? LIMIT 1", (path,)):
+        return
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove replaced media {path}: {e}")
+
+
+async def _normalize(submission_id, problem_id, file_path):
+    thumb_path = duplicate_of = None
+    if IMAGE_NORMALIZE and file_path:
+        try:
+            normalized, thumb_path, image_hash = await normalize(file_path)
+        except Exception as e:
+            # Not a decodable image: the original stays as it is and the stage is not retried
+            logger.warning(f"Submission #{submission_id} kept unnormalized: {e}")
+        else:
+            duplicate_of = await find_duplicate(problem_id, submission_id, image_hash)
+            await execute(
+                "UPDATE submissions SET photo_path=?, thumb_path=?, phash=?, duplicate_of=? WHERE id=?",
+                (normalized, thumb_path, to_db(image_hash), duplicate_of, submission_id)
+            )
+            if normalized != file_path:
+                await release_blob(file_path)
+            file_path = normalized
+    await execute("UPDATE submissions SET normalized_at=? WHERE id=?", (now_ts(), submission_id))
+    return file_path, thumb_path, duplicate_of
+
+
+async def process_submission(sender, submission_id):
+    try:
+        row = await fetch_one("""
+            SELECT user_id, problem_id, file_id, file_kind, photo_path, thumb_path, duplicate_of,
+                   archived_at, normalized_at, notified_at, status
+            FROM submissions WHERE id=?
+        """, (submission_id,))
+        if not row:
+            return False
+        (user_id, problem_id, file_id, file_kind, file_path, thumb_path, duplicate_of,
+         archived_at, normalized_at, notified_at, status) = row
+
+        if archived_at is None:
+            file_path = await _archive(sender, submission_id, file_id)
+            if file_path is None:
+                return False
+        if normalized_at is None:
+            file_path, thumb_path, duplicate_of = await _normalize(submission_id, problem_id, file_path)
+    except sqlite3.Error as e:
+        logger.error(f"Submission #{submission_id} processing error: {e}")
+        return False
+
+    if notified_at is None and status != "pending":
+        # Reviewed or auto-rejected before a reviewer saw it: nothing left to send
+        try:
+            await execute("UPDATE submissions SET notified_at=0 WHERE id=?", (submission_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Submission #{submission_id} processing error: {e}")
+    elif notified_at is None:
+        # Without a thumbnail (normalization off or failed) the user's file goes out by file_id
+        preview = thumb_path or None
+        try:
+            await send_for_review(sender, submission_id, user_id, problem_id, file_id, file_kind, preview, duplicate_of)
+        except Exception as e:
+            logger.error(f"Sending submission #{submission_id} for review failed: {e}")
+            return False
+    return True
+
+
+async def _process_once(sender, submission_id):
+    # False without doing anything if the submission is already being processed
+    if submission_id in _in_flight:
+        return False
+    _in_flight.add(submission_id)
+    try:
+        return await process_submission(sender, submission_id)
+    finally:
+        _in_flight.discard(submission_id)
+
+
+def schedule_processing(sender, submission_id):
+    task = asyncio.create_task(_process_once(sender, submission_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def process_pending(sender, limit=100):
+    # Catches up on stages that failed or were cut off by a restart
+    try:
+        rows = await fetch_all("""
+            SELECT id FROM submissions
+            WHERE file_id IS NOT NULL
+              AND (archived_at IS NULL OR normalized_at IS NULL OR notified_at IS NULL)
+            ORDER BY id LIMIT ?
+        """, (limit,))
+    except sqlite3.Error as e:
+        logger.error(f"Submission sweep read error: {e}")
+        return
+    # Submissions still in their own task (e.g. waiting for a download slot) are left to it
+    ids = [row[0] for row in rows if row[0] not in _in_flight]
+    if not ids:
+        return
+    results = await asyncio.gather(*(_process_once(sender, submission_id) for submission_id in ids))
+    logger.info(f"Submission sweep completed {sum(results)} of {len(ids)} submissions")
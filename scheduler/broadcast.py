@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+    TelegramNetworkError,
+)
+from config.settings import BROADCAST_RATE_LIMIT, BROADCAST_CONCURRENCY, BROADCAST_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+# Global send limiter shared by every broadcast in the process
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        # Telegram flood control applies to the whole bot, so every sender waits
+        resume_at = time.monotonic() + seconds
+        if resume_at > self._paused_until:
+            self._paused_until = resume_at
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+rate_limiter = TokenBucket(BROADCAST_RATE_LIMIT)
+
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    sent_ids: list = field(default_factory=list)
+    failed_ids: list = field(default_factory=list)
+
+
+async def _deliver(user_id, send, bucket, max_retries):
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            await send(user_id)
+            return True
+        except TelegramRetryAfter as e:
+            logger.warning(f"Flood control hit while sending to {user_id}, pausing {e.retry_after}s")
+            bucket.pause(e.retry_after)
+        except TelegramNetworkError as e:
+            logger.warning(f"Network error sending to {user_id} (attempt {attempt + 1}): {e}")
+            await asyncio.sleep(1 + attempt)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.info(f"Cannot deliver to {user_id}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error sending to {user_id}: {e}")
+            return False
+    return False
+
+
+async def broadcast(recipients, send, concurrency=BROADCAST_CONCURRENCY, bucket=None,
+                    max_retries=BROADCAST_MAX_RETRIES, label="broadcast"):
+    # Calls send(user_id) for every recipient with bounded concurrency under the rate limit
+    bucket = bucket or rate_limiter
+    result = BroadcastResult()
+    started = time.monotonic()
+    pending = iter(recipients)
+
+    async def worker():
+        for user_id in pending:
+            if await _deliver(user_id, send, bucket, max_retries):
+                result.sent += 1
+                result.sent_ids.append(user_id)
+            else:
+                result.failed += 1
+                result.failed_ids.append(user_id)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    result.elapsed = time.monotonic() - started
+    logger.info(f"{label}: sent={result.sent} failed={result.failed} elapsed={result.elapsed:.1f}s")
+    return result
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from config.settings import IMAGE_MAX_SIDE, IMAGE_QUALITY, THUMB_MAX_SIDE, THUMB_QUALITY, IMAGE_WORKERS
+from utils import images, media
+
+logger = logging.getLogger(__name__)
+
+# Decoding and re-encoding are CPU-bound, so they run in separate processes and never hold the
+# event loop or the GIL that aiogram's handlers need. The pool starts on first use
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+
+async def normalize(path):
+    # Re-encodes a stored image; returns (normalized path, thumbnail path, perceptual hash)
+    loop = asyncio.get_running_loop()
+    full, thumb, image_hash = await loop.run_in_executor(
+        _executor(),
+        partial(images.render, path, IMAGE_MAX_SIDE, IMAGE_QUALITY, THUMB_MAX_SIDE, THUMB_QUALITY)
+    )
+    full_path = await asyncio.to_thread(media.put_bytes, full, ".jpg")
+    thumb_path = await asyncio.to_thread(media.put_bytes, thumb, ".jpg")
+    return full_path, thumb_path, image_hash
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,13 +1,26 @@
+import asyncio
 import sqlite3
-from datetime import datetime, timedelta
+from functools import partial
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
-from config.settings import DB_PATH, BOT_TOKEN, ADMIN_ID, TIMEZONE, COINS_PER_DIFFICULTY, COIN_PENALTY
-from callbacks.callbacks import ProblemCB
+from aiogram.types import FSInputFile
+from config.settings import BOT_TOKEN, ADMIN_ID, COINS_PER_DIFFICULTY, COIN_PENALTY, REMINDER_LEAD_HOURS, DEFAULT_LANGUAGE
+from scheduler.outbox import register_sender, enqueue_problem, drain_outbox
+from utils.timestamps import now_ts, format_ts
+from database.ledger import penalize_non_submitters
+from cache.leaderboard import leaderboard
+from cache.events import user_changed, problems_changed
+from cache.catalog import catalog
+from utils.i18n import messages
+from utils import keyboards
+from database.db import set_problem_photo_file_id, fetch_one, fetch_all, execute, run_in_transaction
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from zoneinfo import ZoneInfo
 import os
+import logging
+
+logger = logging.getLogger(__name__)
+
 bot = Bot(
     token=BOT_TOKEN,
     default=DefaultBotProperties(
@@ -16,155 +29,193 @@ bot = Bot(
     )
 )
 
-def get_translations():
-    return {
-        "task_notification": "📘 Kunlik masala #{id} ({category} - {difficulty}):\n\n{text}\n\n"
-                           "Deadline: {deadline}\n"
-                           "🎁 To‘g‘ri yechim uchun {coins} tanga!",
-        "reminder": "⏰ Masala #{id} ({category} - {difficulty}) uchun 1 soat qoldi!\n"
-                   "Tezroq yechim yuboring: {text}\nDeadline: {deadline}",
-        "penalty": "⚠️ Masala #{id} topshirmadingiz! {penalty} tanga ayirildi.\n💰 Joriy balans: {coins}"
-    }
+def get_translations(language=DEFAULT_LANGUAGE):
+    return messages("jobs", language)
 
-async def check_deadlines():
-    now = datetime.now(TIMEZONE)
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, deadline FROM problems")
-        problems = cursor.fetchall()
-        cursor.execute("SELECT user_id FROM users")
-        users = [row[0] for row in cursor.fetchall()]
-        
-        translations = get_translations()
-        for pid, deadline in problems:
-            deadline_dt = datetime.strptime(deadline, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TIMEZONE)
-            if deadline_dt < now:
-                cursor.execute("SELECT user_id FROM submissions WHERE problem_id=?", (pid,))
-                submitted_users = {row[0] for row in cursor.fetchall()}
-                for user_id in users:
-                    if user_id != ADMIN_ID and user_id not in submitted_users:
-                        cursor.execute("UPDATE users SET coins = GREATEST(coins - ?, 0) WHERE user_id=?", 
-                                      (COIN_PENALTY, user_id))
-                        cursor.execute("SELECT coins FROM users WHERE user_id=?", (user_id,))
-                        coins = cursor.fetchone()[0]
-                        try:
-                            await bot.send_message(
-                                user_id,
-                                translations["penalty"].format(id=pid, penalty=COIN_PENALTY, coins=coins),
-                                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data=ProblemCB(action="menu System: menu", problem_id=0).pack())]
-                                ]),
-                                protect_content=True
-                            )
-                        except Exception:
-                            pass
-                cursor.execute("""
-                    UPDATE submissions
-                    SET status='auto_rejected', reviewed_at=CURRENT_TIMESTAMP
-                    WHERE problem_id=? AND status='pending'
-                """, (pid,))
-        conn.commit()
-    except sqlite3.Error:
-        print("Deadline check error")
-    finally:
-        conn.close()
-
-async def send_daily_problems():
-    now = datetime.now(TIMEZONE)
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+async def penalty_sender(sender, problem_id, language):
+    rows = await fetch_all(
+        "SELECT user_id, -delta, balance_after FROM coin_transactions WHERE reason='penalty' AND source_id=?",
+        (problem_id,)
+    )
+    penalties = {user_id: (amount, coins) for user_id, amount, coins in rows}
+
+    translations = get_translations(language)
+    keyboard = keyboards.back(language)
+
+    async def send(user_id):
+        amount, coins = penalties.get(user_id, (COIN_PENALTY, 0))
+        await sender.send_message(
+            user_id,
+            translations["penalty"].format(id=problem_id, penalty=amount, coins=coins),
+            reply_markup=keyboard,
+            protect_content=True
+        )
+
+    return send
+
+register_sender("penalty", penalty_sender)
+
+def _sweep_deadlines(cursor, now):
+    cursor.execute("SELECT value FROM job_state WHERE name='deadline_sweep'")
+    row = cursor.fetchone()
+    last_run = int(row[0]) if row else 0
+    cursor.execute(
+        "SELECT id FROM problems WHERE deadline_ts > ? AND deadline_ts <= ? ORDER BY deadline_ts",
+        (last_run, now)
+    )
+    expired = [r[0] for r in cursor.fetchall()]
+
+    balances = []
+    rejected = set()
+    for pid in expired:
+        penalize_non_submitters(cursor, pid, COIN_PENALTY, now, ADMIN_ID)
         cursor.execute(
-            "SELECT id, text, image_path, difficulty, category, deadline FROM problems "
-            "WHERE scheduled_at <= ? AND scheduled_at IS NOT NULL",
-            (now.strftime("%Y-%m-%d %H:%M:%S"),)
+            "SELECT user_id, balance_after FROM coin_transactions WHERE reason='penalty' AND source_id=? AND created_at=?",
+            (pid, now)
         )
-        problems = cursor.fetchall()
-        cursor.execute("SELECT user_id FROM users")
-        users = [row[0] for row in cursor.fetchall()]
-        
-        translations = get_translations()
-        for problem_id, text, image_path, difficulty, category, deadline in problems:
-            coins = COINS_PER_DIFFICULTY.get(difficulty.lower(), COINS_PER_DIFFICULTY["medium"])
-            submit_keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text="✅ Yechim yuborish",
-                        callback_data=ProblemCB(action="submit", problem_id=problem_id).pack()
-                    )]
-                ]
+        balances.extend(cursor.fetchall())
+        cursor.execute("""
+            INSERT OR IGNORE INTO outbox (problem_id, user_id, kind)
+            SELECT source_id, user_id, 'penalty' FROM coin_transactions
+            WHERE reason='penalty' AND source_id=? AND created_at=?
+        """, (pid, now))
+        cursor.execute("""
+            UPDATE submissions
+            SET status='auto_rejected', reviewed_at=CURRENT_TIMESTAMP
+            WHERE problem_id=? AND status='pending'
+            RETURNING user_id
+        """, (pid,))
+        rejected.update(r[0] for r in cursor.fetchall())
+    cursor.execute(
+        "INSERT OR REPLACE INTO job_state (name, value) VALUES ('deadline_sweep', ?)",
+        (str(now),)
+    )
+    return expired, balances, rejected
+
+async def check_deadlines():
+    # Only problems whose deadline passed since the previous sweep are processed;
+    # the coin ledger makes re-running a sweep harmless
+    now = now_ts()
+    try:
+        expired, balances, rejected = await run_in_transaction(_sweep_deadlines, now)
+        for user_id, coins in balances:
+            leaderboard.update(user_id, coins)
+        user_changed(*rejected, *(user_id for user_id, _ in balances))
+        if expired:
+            problems_changed()
+            logger.info(f"Deadline sweep processed problems {expired}")
+    except sqlite3.Error as e:
+        logger.error(f"Deadline check error: {e}")
+        return
+    await drain_outbox(bot)
+
+async def problem_sender(sender, problem_id, language):
+    problem = await fetch_one(
+        "SELECT text, image_path, difficulty, category, deadline_ts, photo_file_id FROM problems WHERE id=?",
+        (problem_id,)
+    )
+    if not problem:
+        return None
+    text, image_path, difficulty, category, deadline, photo_file_id = problem
+
+    translations = get_translations(language)
+    coins = COINS_PER_DIFFICULTY.get(difficulty.lower(), COINS_PER_DIFFICULTY["medium"])
+    message_text = translations["task_notification"].format(
+        id=problem_id, text=text, category=category, difficulty=difficulty,
+        deadline=format_ts(deadline), coins=coins
+    )
+    submit_keyboard = keyboards.submit(problem_id, language)
+    has_image = bool(photo_file_id or (image_path and os.path.exists(image_path)))
+    photo = photo_file_id
+    upload_lock = asyncio.Lock()
+
+    async def send(user_id):
+        nonlocal photo
+        if has_image and photo is None:
+            # Only one upload: other workers wait here and then reuse the returned file_id
+            async with upload_lock:
+                if photo is None:
+                    sent = await sender.send_photo(
+                        user_id,
+                        FSInputFile(image_path),
+                        caption=message_text,
+                        reply_markup=submit_keyboard,
+                        protect_content=True
+                    )
+                    photo = sent.photo[-1].file_id
+                    await set_problem_photo_file_id(problem_id, photo)
+                    catalog.update(problem_id, photo_file_id=photo)
+                    return
+        if has_image:
+            await sender.send_photo(
+                user_id,
+                photo,
+                caption=message_text,
+                reply_markup=submit_keyboard,
+                protect_content=True
             )
-            
-            for user_id in users:
-                if user_id != ADMIN_ID:
-                    try:
-                        message_text = translations["task_notification"].format(
-                            id=problem_id, text=text, category=category, difficulty=difficulty,
-                            deadline=deadline, coins=coins
-                        )
-                        if image_path and os.path.exists(image_path):
-                            await bot.send_photo(
-                                user_id,
-                                FSInputFile(image_path),
-                                caption=message_text,
-                                reply_markup=submit_keyboard,
-                                protect_content=True
-                            )
-                        else:
-                            await bot.send_message(
-                                user_id,
-                                message_text,
-                                reply_markup=submit_keyboard,
-                                protect_content=True
-                            )
-                    except Exception:
-                        pass
-            
-            cursor.execute("UPDATE problems SET scheduled_at=NULL WHERE id=?", (problem_id,))
-            conn.commit()
-    except sqlite3.Error:
-        print("Problem sending error")
-    finally:
-        conn.close()
-
-async def send_deadline_reminders():
-    now = datetime.now(TIMEZONE)
-    one_hour_later = now + timedelta(hours=1)
+        else:
+            await sender.send_message(
+                user_id,
+                message_text,
+                reply_markup=submit_keyboard,
+                protect_content=True
+            )
+
+    return send
+
+register_sender("problem", problem_sender)
+
+async def publish_problem(sender, problem_id):
+    await enqueue_problem(problem_id)
+    return await drain_outbox(sender)
+
+async def publish_scheduled_problem(problem_id):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, text, difficulty, category, deadline FROM problems "
-            "WHERE deadline BETWEEN ? AND ?",
-            (now.strftime("%Y-%m-%d %H:%M:%S"), one_hour_later.strftime("%Y-%m-%d %H:%M:%S"))
-        )
-        problems = cursor.fetchall()
-        cursor.execute("SELECT user_id FROM users")
-        users = [row[0] for row in cursor.fetchall()]
-        
-        translations = get_translations()
-        for problem_id, text, difficulty, category, deadline in problems:
-            cursor.execute("SELECT user_id FROM submissions WHERE problem_id=?", (problem_id,))
-            submitted_users = {row[0] for row in cursor.fetchall()}
-            
-            for user_id in users:
-                if user_id != ADMIN_ID and user_id not in submitted_users:
-                    try:
-                        message_text = translations["reminder"].format(
-                            id=problem_id, text=text[:100] + "..." if len(text) > 100 else text,
-                            category=category, difficulty=difficulty, deadline=deadline
-                        )
-                        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(
-                                text="✅ Yechim yuborish",
-                                callback_data=ProblemCB(action="submit", problem_id=problem_id).pack()
-                            )]
-                        ])
-                        await bot.send_message(user_id, message_text, reply_markup=keyboard, protect_content=True)
-                    except Exception:
-                        pass
-    except sqlite3.Error:
-        print("Reminder sending error")
-    finally:
-        conn.close()
\ No newline at end of file
+        await enqueue_problem(problem_id)
+    except sqlite3.Error as e:
+        logger.error(f"Problem #{problem_id} publishing error: {e}")
+    await drain_outbox(bot)
+
+async def resume_outbox():
+    await drain_outbox(bot)
+
+async def reminder_sender(sender, problem_id, language, hours):
+    problem = await fetch_one("SELECT text, difficulty, category, deadline_ts FROM problems WHERE id=?", (problem_id,))
+    if not problem:
+        return None
+    text, difficulty, category, deadline = problem
+
+    # Every recipient of a language gets the same text and keyboard, so both are built once per group
+    translations = get_translations(language)
+    message_text = translations["reminder"].format(
+        id=problem_id, hours=hours, text=text[:100] + "..." if len(text) > 100 else text,
+        category=category, difficulty=difficulty, deadline=format_ts(deadline)
+    )
+    keyboard = keyboards.submit(problem_id, language)
+
+    async def send(user_id):
+        await sender.send_message(user_id, message_text, reply_markup=keyboard, protect_content=True)
+
+    return send
+
+for _hours in REMINDER_LEAD_HOURS:
+    register_sender(f"reminder_{_hours}h", partial(reminder_sender, hours=_hours))
+
+async def send_deadline_reminders(problem_id, hours):
+    # Outbox uniqueness on (problem, user, kind) means each lead time reminds a user at most once
+    kind = f"reminder_{hours}h"
+    try:
+        cursor = await execute("""
+            INSERT OR IGNORE INTO outbox (problem_id, user_id, kind)
+            SELECT p.id, u.user_id, ?
+            FROM problems p, users u
+            WHERE p.id=? AND p.scheduled_ts IS NULL AND u.user_id != ?
+              AND NOT EXISTS (SELECT 1 FROM submissions s WHERE s.problem_id=p.id AND s.user_id=u.user_id)
+        """, (kind, problem_id, ADMIN_ID))
+        queued = cursor.rowcount
+        logger.info(f"Queued {queued} '{kind}' reminders for problem #{problem_id}")
+    except sqlite3.Error as e:
+        logger.error(f"Reminder sending error: {e}")
+        return
+    await drain_outbox(bot)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import sqlite3
+from config.settings import ADMIN_ID, OUTBOX_BATCH_SIZE, DEFAULT_LANGUAGE
+from database.db import fetch_all, run_in_transaction
+from scheduler.broadcast import broadcast, BroadcastResult
+from cache.catalog import catalog
+from cache.events import problems_changed
+
+logger = logging.getLogger(__name__)
+
+# kind -> async factory(sender, problem_id, language) returning an async send(user_id) callable;
+# a factory runs once per (kind, problem, language) group, so messages are rendered once per group
+_senders = {}
+_drain_lock = asyncio.Lock()
+
+
+def register_sender(kind, factory):
+    _senders[kind] = factory
+
+
+def _enqueue(cursor, problem_id, kind):
+    cursor.execute(
+        "INSERT OR IGNORE INTO outbox (problem_id, user_id, kind) "
+        "SELECT ?, user_id, ? FROM users WHERE user_id != ?",
+        (problem_id, kind, ADMIN_ID)
+    )
+    queued = cursor.rowcount
+    if kind == "problem":
+        cursor.execute("UPDATE problems SET scheduled_at=NULL, scheduled_ts=NULL WHERE id=?", (problem_id,))
+    return queued
+
+
+async def enqueue_problem(problem_id, kind="problem"):
+    # Queue one row per recipient and mark the problem published in the same transaction,
+    # so a restart can neither lose the fan-out nor start it from scratch
+    queued = await run_in_transaction(_enqueue, problem_id, kind)
+    if kind == "problem":
+        catalog.update(problem_id, scheduled_ts=None)
+        problems_changed()
+    logger.info(f"Queued {queued} '{kind}' messages for problem #{problem_id}")
+    return queued
+
+
+async def _fetch_batch(after_id):
+    return await fetch_all(
+        "SELECT o.id, o.problem_id, o.user_id, o.kind, COALESCE(u.language, ?) FROM outbox o "
+        "LEFT JOIN users u ON u.user_id = o.user_id "
+        "WHERE o.status='pending' AND o.id > ? ORDER BY o.id LIMIT ?",
+        (DEFAULT_LANGUAGE, after_id, OUTBOX_BATCH_SIZE)
+    )
+
+
+def _mark(cursor, sent_ids, failed_ids):
+    cursor.executemany(
+        "UPDATE outbox SET status='sent', sent_at=CURRENT_TIMESTAMP WHERE id=?",
+        [(row_id,) for row_id in sent_ids]
+    )
+    cursor.executemany(
+        "UPDATE outbox SET status='failed', sent_at=CURRENT_TIMESTAMP WHERE id=?",
+        [(row_id,) for row_id in failed_ids]
+    )
+
+
+async def _mark_batch(sent_ids, failed_ids):
+    await run_in_transaction(_mark, sent_ids, failed_ids)
+
+
+async def drain_outbox(sender):
+    total = BroadcastResult()
+    async with _drain_lock:
+        last_id = 0
+        while True:
+            try:
+                rows = await _fetch_batch(last_id)
+            except sqlite3.Error as e:
+                logger.error(f"Outbox read error: {e}")
+                break
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            groups = {}
+            for row_id, problem_id, user_id, kind, language in rows:
+                groups.setdefault((kind, problem_id, language), {})[user_id] = row_id
+
+            sent_rows, failed_rows = [], []
+            for (kind, problem_id, language), recipients in groups.items():
+                factory = _senders.get(kind)
+                send = await factory(sender, problem_id, language) if factory else None
+                if send is None:
+                    logger.error(f"Dropping {len(recipients)} '{kind}' outbox rows for problem #{problem_id}")
+                    failed_rows.extend(recipients.values())
+                    continue
+                result = await broadcast(list(recipients), send, label=f"Outbox {kind} #{problem_id} [{language}]")
+                sent_rows.extend(recipients[user_id] for user_id in result.sent_ids)
+                failed_rows.extend(recipients[user_id] for user_id in result.failed_ids)
+                total.sent += result.sent
+                total.failed += result.failed
+                total.elapsed += result.elapsed
+
+            # Checkpoint: the batch's outcome is committed before the next batch starts
+            try:
+                await _mark_batch(sent_rows, failed_rows)
+            except sqlite3.Error as e:
+                logger.error(f"Outbox checkpoint error: {e}")
+                break
+    return total
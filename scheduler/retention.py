@@ -0,0 +1,194 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from config.settings import (
+    RETENTION_POLICIES, RETENTION_BATCH, ARCHIVES_DIR, MEDIA_DIR, MEDIA_QUOTA_BYTES, SUBMISSIONS_DIR
+)
+from database.db import fetch_one, fetch_all, execute, run_in_transaction
+from scheduler.archive import release_blob
+from utils.media import TMP_DIR
+from utils.timestamps import now_ts
+
+logger = logging.getLogger(__name__)
+
+# Daily housekeeping for files on disk:
+#  - reviewed submissions past their policy age have their image and thumbnail packed into a zip in
+#    ARCHIVES_DIR; photo_path/thumb_path become "archives/<name>.zip#<member>" (utils.media.read_blob
+#    resolves it)
+#  - exports and partial downloads past their age are deleted
+#  - above MEDIA_QUOTA_BYTES every reviewed submission is packed regardless of age, then whole archives
+#    are evicted, least recently read first; the rows that pointed into them are cleared (the Telegram
+#    file_id still identifies the original). Files of pending submissions are never touched
+
+
+def _pack(paths, archive_path):
+    # Written under a temporary name and renamed, so a crash never leaves a half-written archive
+    # that rows point at. Returns {source path: member name} for the files that were packed
+    tmp_path = archive_path.with_suffix(".part")
+    members = {}
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            member = os.path.basename(path)
+            if member not in members.values():
+                zf.write(path, member)
+            members[path] = member
+    if members:
+        os.replace(tmp_path, archive_path)
+    else:
+        os.remove(tmp_path)
+    return members
+
+
+def _repoint(cursor, rewrites):
+    # A pending submission can share a blob with a reviewed one; it keeps the loose file, which
+    # release_blob then leaves in place
+    cursor.executemany("UPDATE submissions SET photo_path=? WHERE photo_path=? AND status != 'pending'", rewrites)
+    cursor.executemany("UPDATE submissions SET thumb_path=? WHERE thumb_path=? AND status != 'pending'", rewrites)
+
+
+async def pack_reviewed(max_age):
+    rows = await fetch_all("""
+        SELECT photo_path, thumb_path FROM submissions
+        WHERE status != 'pending'
+          AND ((photo_path != '' AND instr(photo_path, '#') = 0) OR (thumb_path != '' AND instr(thumb_path, '#') = 0))
+          AND reviewed_at < datetime('now', ?)
+        ORDER BY reviewed_at LIMIT ?
+    """, (f"-{max_age} seconds", RETENTION_BATCH))
+    # Identical uploads share one blob, so a path can appear on several rows
+    paths = list(dict.fromkeys(path for row in rows for path in row if path and "#" not in path))
+    if not paths:
+        return 0, 0
+
+    ARCHIVES_DIR.mkdir(parents=True, exist_ok=True)
+    # The random suffix keeps back-to-back packs (the quota loop runs several a second) from sharing a name
+    archive_path = ARCHIVES_DIR / f"submissions_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.zip"
+    members = await asyncio.to_thread(_pack, paths, archive_path)
+    # Files that no longer exist are unreferenced, so the rows stop pointing at them
+    rewrites = [(f"{archive_path}#{members[p]}" if p in members else "", p) for p in paths]
+    await run_in_transaction(_repoint, rewrites)
+
+    freed = 0
+    for path in members:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        await release_blob(path)
+        if not os.path.exists(path):
+            freed += size
+    if members:
+        freed = max(freed - os.path.getsize(archive_path), 0)
+    return len(members), freed
+
+
+def _remove_older(directory, pattern, max_age):
+    cutoff = time.time() - max_age
+    removed = freed = 0
+    if not directory.exists():
+        return removed, freed
+    for entry in directory.glob(pattern):
+        try:
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                entry.unlink()
+                removed += 1
+                freed += stat.st_size
+        except OSError as e:
+            logger.warning(f"Could not remove {entry}: {e}")
+    return removed, freed
+
+
+def _usage(directory):
+    total = 0
+    if not directory.exists():
+        return total
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+async def _media_usage():
+    return await asyncio.to_thread(lambda: _usage(MEDIA_DIR) + _usage(ARCHIVES_DIR))
+
+
+async def enforce_quota():
+    used = await _media_usage()
+    evicted = freed = 0
+    if used <= MEDIA_QUOTA_BYTES:
+        return used, evicted, freed
+
+    # Loose files of reviewed submissions are packed first, whatever their age, so that only
+    # archives are left to evict
+    while True:
+        packed, _ = await pack_reviewed(0)
+        if not packed:
+            break
+    used = await _media_usage()
+
+    # read_blob bumps an archive's modification time on every read (access times are often not kept),
+    # so mtime orders them least recently used first
+    archives = sorted(ARCHIVES_DIR.glob("*.zip"), key=lambda p: p.stat().st_mtime)
+    for archive in archives:
+        if used - freed <= MEDIA_QUOTA_BYTES:
+            break
+        prefix = f"{archive}#"
+        bounds = (prefix, prefix[:-1] + chr(ord("#") + 1))
+        # Ranges on the photo_path and thumb_path indexes instead of LIKE, which SQLite would not index here
+        await execute("UPDATE submissions SET photo_path='' WHERE photo_path >= ? AND photo_path < ?", bounds)
+        await execute("UPDATE submissions SET thumb_path='' WHERE thumb_path >= ? AND thumb_path < ?", bounds)
+        size = archive.stat().st_size
+        archive.unlink()
+        evicted += 1
+        freed += size
+        logger.info(f"Evicted media archive {archive} ({size} bytes)")
+    if used - freed > MEDIA_QUOTA_BYTES:
+        logger.warning(f"Media uses {used - freed} bytes, above the {MEDIA_QUOTA_BYTES} byte quota, "
+                       f"with no archives left to evict (the rest belongs to pending submissions)")
+    return used - freed, evicted, freed
+
+
+async def run_retention():
+    report = {}
+    try:
+        report["packed"], report["packed_freed"] = await pack_reviewed(RETENTION_POLICIES["reviewed_submissions"])
+        report["exports_removed"], report["exports_freed"] = await asyncio.to_thread(
+            _remove_older, SUBMISSIONS_DIR, "stats_*.xlsx", RETENTION_POLICIES["exports"]
+        )
+        report["partials_removed"], _ = await asyncio.to_thread(
+            _remove_older, TMP_DIR, "*.part", RETENTION_POLICIES["partial_downloads"]
+        )
+        report["used"], report["evicted"], report["evicted_freed"] = await enforce_quota()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Retention run failed: {e}")
+        return None
+
+    report["reclaimed"] = report["packed_freed"] + report["exports_freed"] + report["evicted_freed"]
+    report["finished_at"] = now_ts()
+    try:
+        await execute(
+            "INSERT OR REPLACE INTO job_state (name, value) VALUES ('retention_report', ?)",
+            (json.dumps(report),)
+        )
+    except sqlite3.Error as e:
+        logger.error(f"Could not save retention report: {e}")
+    logger.info(f"Retention: packed {report['packed']} files, removed {report['exports_removed']} exports, "
+                f"evicted {report['evicted']} archives, reclaimed {report['reclaimed']} bytes, "
+                f"{report['used']} bytes in use")
+    return report
+
+
+async def last_report():
+    row = await fetch_one("SELECT value FROM job_state WHERE name='retention_report'")
+    return json.loads(row[0]) if row else None
@@ -0,0 +1,90 @@
+import logging
+import sqlite3
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import FSInputFile
+from config.settings import ADMIN_IDS, REVIEW_CLAIM_TIMEOUT, REVIEW_CLAIM_TTL
+from database.db import fetch_one, execute, run_in_transaction
+from database import review_queue
+from cache.profiles import user_language
+from utils import keyboards
+from utils.i18n import messages
+from utils.timestamps import now_ts
+
+logger = logging.getLogger(__name__)
+
+
+async def _deliver(sender, reviewer, caption, keyboard, file_id, file_kind, preview_path):
+    # The thumbnail is uploaded as a photo when there is one (the full file is sent on request);
+    # otherwise the user's own file is forwarded by file_id
+    if preview_path:
+        await sender.send_photo(reviewer, FSInputFile(preview_path), caption=caption,
+                                reply_markup=keyboard, protect_content=True)
+    else:
+        send_file = sender.send_photo if file_kind == "photo" else sender.send_document
+        await send_file(reviewer, file_id, caption=caption, reply_markup=keyboard, protect_content=True)
+
+
+async def send_for_review(sender, submission_id, user_id, problem_id, file_id, file_kind, preview_path=None,
+                          duplicate_of=None, exclude=()):
+    # Goes to the least loaded reviewer; if Telegram refuses (e.g. a reviewer blocked the bot) the next
+    # one in load order gets it. notified_at records that a reviewer has the submission
+    reviewers = await run_in_transaction(review_queue.assign, submission_id, ADMIN_IDS, now_ts(), tuple(exclude))
+    for i, reviewer in enumerate(reviewers):
+        if i:
+            await execute("UPDATE submissions SET assigned_to=? WHERE id=?", (reviewer, submission_id))
+        # Caption and buttons are in the reviewer's own language
+        language = await user_language(reviewer)
+        translations = messages("admin", language)
+        caption = translations["review_caption"].format(id=submission_id, user_id=user_id, problem_id=problem_id)
+        if duplicate_of:
+            caption += translations["review_duplicate"].format(id=duplicate_of)
+        keyboard = keyboards.review(submission_id, language, full=bool(preview_path), duplicate_of=duplicate_of)
+        try:
+            await _deliver(sender, reviewer, caption, keyboard, file_id, file_kind, preview_path)
+            break
+        except TelegramAPIError as e:
+            if i == len(reviewers) - 1:
+                raise
+            logger.warning(f"Reviewer {reviewer} unreachable for submission #{submission_id}: {e}")
+    await execute(
+        "UPDATE submissions SET notified_at=?, offered_to=COALESCE(offered_to || ',', '') || ? WHERE id=?",
+        (now_ts(), str(reviewer), submission_id)
+    )
+    return reviewer
+
+
+async def reassign_stale(sender):
+    # Expired claims become unclaimed again; anything unclaimed past the timeout moves to a reviewer who
+    # has not had it yet, so it makes at most one round. The earlier reviewers' buttons keep working:
+    # whoever claims first gets it
+    now = now_ts()
+    try:
+        released = await run_in_transaction(review_queue.expire_claims, now - REVIEW_CLAIM_TTL)
+        if released:
+            logger.info(f"Released {released} review claims without a verdict")
+        if len(ADMIN_IDS) < 2:
+            return
+        stale = await review_queue.unclaimed_since(now - REVIEW_CLAIM_TIMEOUT, len(ADMIN_IDS) - 1)
+    except sqlite3.Error as e:
+        logger.error(f"Review queue sweep error: {e}")
+        return
+
+    for submission_id, assigned_to, offered_to in stale:
+        try:
+            row = await fetch_one(
+                "SELECT user_id, problem_id, file_id, file_kind, thumb_path, duplicate_of "
+                "FROM submissions WHERE id=?",
+                (submission_id,)
+            )
+            user_id, problem_id, file_id, file_kind, thumb_path, duplicate_of = row
+            preview = thumb_path if thumb_path and "#" not in thumb_path else None
+            exclude = review_queue.offered(offered_to) | {assigned_to}
+            await execute("UPDATE submissions SET reassignments=reassignments+1 WHERE id=?", (submission_id,))
+            if exclude.issuperset(ADMIN_IDS):
+                # Every reviewer has had it already; it stays where it is
+                continue
+            reviewer = await send_for_review(sender, submission_id, user_id, problem_id, file_id, file_kind,
+                                             preview, duplicate_of, exclude=tuple(exclude))
+            logger.info(f"Submission #{submission_id} reassigned from {assigned_to} to {reviewer}")
+        except (sqlite3.Error, TelegramAPIError) as e:
+            logger.error(f"Reassigning submission #{submission_id} failed: {e}")
@@ -0,0 +1,53 @@
+import logging
+from datetime import datetime, timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from config.settings import TIMEZONE, REMINDER_LEAD_HOURS
+from database.db import fetch_one, fetch_all
+from utils.timestamps import from_ts
+from scheduler.jobs import check_deadlines, publish_scheduled_problem, send_deadline_reminders
+
+logger = logging.getLogger(__name__)
+
+scheduler = AsyncIOScheduler(timezone=TIMEZONE)
+
+
+def _add_date_job(job_id, func, run_at, args=()):
+    # Timers missed while the bot was down fire as soon as they are registered
+    now = datetime.now(TIMEZONE)
+    scheduler.add_job(
+        func, "date", run_date=max(run_at, now), args=args, id=job_id,
+        replace_existing=True, misfire_grace_time=None
+    )
+
+
+def _schedule_deadline(problem_id, deadline_ts):
+    deadline_dt = from_ts(deadline_ts)
+    if deadline_dt > datetime.now(TIMEZONE):
+        # A reminder whose lead time was missed still goes out once, as long as the deadline is ahead
+        for hours in REMINDER_LEAD_HOURS:
+            _add_date_job(
+                f"reminder_{hours}h_{problem_id}", send_deadline_reminders,
+                deadline_dt - timedelta(hours=hours), (problem_id, hours)
+            )
+    _add_date_job(f"deadline_{problem_id}", check_deadlines, deadline_dt)
+
+
+def schedule_problem(problem_id, scheduled_ts, deadline_ts):
+    # One-shot jobs: publish when due (if not published yet), remind, and sweep right at the deadline
+    if scheduled_ts is not None:
+        _add_date_job(f"publish_{problem_id}", publish_scheduled_problem, from_ts(scheduled_ts), (problem_id,))
+    _schedule_deadline(problem_id, deadline_ts)
+
+
+async def restore_timers():
+    # Rebuild pending timers from the DB; only unpublished problems and unswept deadlines qualify
+    row = await fetch_one("SELECT value FROM job_state WHERE name='deadline_sweep'")
+    last_sweep = int(row[0]) if row else 0
+    pending = await fetch_all("SELECT id, scheduled_ts FROM problems WHERE scheduled_ts IS NOT NULL")
+    deadlines = await fetch_all("SELECT id, deadline_ts FROM problems WHERE deadline_ts > ?", (last_sweep,))
+
+    for problem_id, scheduled_ts in pending:
+        _add_date_job(f"publish_{problem_id}", publish_scheduled_problem, from_ts(scheduled_ts), (problem_id,))
+    for problem_id, deadline in deadlines:
+        _schedule_deadline(problem_id, deadline)
+    logger.info(f"Restored {len(pending)} publish and {len(deadlines)} deadline timers")
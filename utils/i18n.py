@@ -0,0 +1,63 @@
+import json
+from string import Formatter
+from config.settings import LOCALES_DIR, SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE
+
+# Message files are read and parsed once at import; handlers get shared read-only dicts
+
+
+class Template(str):
+    # A message string whose {placeholders} were split out at load time, so format() only joins pieces
+    def __new__(cls, text):
+        self = super().__new__(cls, text)
+        self._parts = tuple(Formatter().parse(text))
+        return self
+
+    def format(self, **values):
+        out = []
+        for literal, field, spec, conversion in self._parts:
+            out.append(literal)
+            if field is not None:
+                value = values[field]
+                if conversion == "r":
+                    value = repr(value)
+                elif conversion == "s":
+                    value = str(value)
+                out.append(format(value, spec or ""))
+        return "".join(out)
+
+
+def _load(language):
+    with open(LOCALES_DIR / f"{language}.json", encoding="utf-8") as f:
+        return {
+            section: {key: Template(text) for key, text in messages.items()}
+            for section, messages in json.load(f).items()
+        }
+
+
+def _build():
+    default = _load(DEFAULT_LANGUAGE)
+    catalog = {DEFAULT_LANGUAGE: default}
+    for language in SUPPORTED_LANGUAGES:
+        if language == DEFAULT_LANGUAGE:
+            continue
+        own = _load(language)
+        catalog[language] = {
+            section: {**messages, **own.get(section, {})} for section, messages in default.items()
+        }
+    return catalog
+
+
+_CATALOG = _build()
+
+
+def resolve_language(language):
+    return language if language in _CATALOG else DEFAULT_LANGUAGE
+
+
+def messages(section, language=DEFAULT_LANGUAGE):
+    return _CATALOG[resolve_language(language)][section]
+
+
+def variants(section, key):
+    # The same message in every language, e.g. for matching a reply-keyboard button's text
+    return {catalog[section][key] for catalog in _CATALOG.values()}
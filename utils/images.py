@@ -0,0 +1,52 @@
+import io
+import math
+from PIL import Image, ImageOps
+
+# Runs inside worker processes: plain functions over paths and bytes, no bot or database state
+
+
+def _encode(image, max_side, quality):
+    copy = image.copy()
+    copy.thumbnail((max_side, max_side), Image.LANCZOS)
+    buffer = io.BytesIO()
+    copy.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+# DCT-II basis for the 8 lowest frequencies of a 32-sample signal
+_DCT = [[math.cos(math.pi * (2 * x + 1) * u / 64) for x in range(32)] for u in range(8)]
+
+
+def phash(image):
+    # 64-bit perceptual hash: signs of the 8x8 low-frequency DCT block against its median.
+    # Recompression, resizing and small crops move few bits, so near-duplicates are close in
+    # Hamming distance
+    gray = image.convert("L").resize((32, 32), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    rows = [pixels[i * 32:(i + 1) * 32] for i in range(32)]
+    # Separable transform: rows first, then columns, keeping only the low 8x8 corner
+    row_dct = [[sum(b * p for b, p in zip(basis, row)) for basis in _DCT] for row in rows]
+    coefficients = [
+        sum(basis[y] * row_dct[y][u] for y in range(32))
+        for basis in _DCT for u in range(8)
+    ]
+    # The DC term only reflects overall brightness, so it is left out of the median
+    median = sorted(coefficients[1:])[31]
+    value = 0
+    for c in coefficients:
+        value = (value << 1) | (c > median)
+    return value
+
+
+def render(path, max_side, quality, thumb_side, thumb_quality):
+    # Decodes an image and returns (normalized JPEG bytes, thumbnail JPEG bytes, perceptual hash)
+    with Image.open(path) as image:
+        # Phone photos carry their rotation in EXIF; apply it so the re-encoded file is upright
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            # Transparent PNGs are flattened onto white rather than black
+            background = Image.new("RGB", image.size, "white")
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        return _encode(image, max_side, quality), _encode(image, thumb_side, thumb_quality), phash(image)
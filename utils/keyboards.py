@@ -0,0 +1,148 @@
+from functools import lru_cache
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config.settings import SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE, KEYBOARD_CACHE_SIZE
+from callbacks.callbacks import TaskCB, ProblemCB, LanguageCB, CategoryCB, SubmissionCB
+from utils.i18n import messages, resolve_language
+
+# Markups are built once and shared between updates, so callers must never mutate them;
+# a keyboard that differs per call should get its own memoized builder here instead
+
+LANGUAGE_NAMES = {"uz": "🇺🇿 O‘zbekcha", "en": "🇬🇧 English"}
+
+
+def _button(text, callback_data):
+    return InlineKeyboardButton(text=text, callback_data=callback_data.pack())
+
+
+@lru_cache(maxsize=None)
+def _main_menu(language):
+    t = messages("common", language)
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [_button(t["btn_panel"], TaskCB(action="panel", problem_id=0)),
+         _button(t["btn_coins"], TaskCB(action="coins", problem_id=0))],
+        [_button(t["btn_history"], TaskCB(action="history", problem_id=0)),
+         _button(t["btn_leaderboard"], TaskCB(action="leaderboard", problem_id=0))],
+        [_button(t["btn_top_week"], TaskCB(action="top_week", problem_id=0)),
+         _button(t["btn_top_month"], TaskCB(action="top_month", problem_id=0))],
+        [_button(t["btn_progress"], TaskCB(action="progress", problem_id=0)),
+         _button(t["btn_language"], TaskCB(action="language", problem_id=0))]
+    ])
+
+
+def main_menu(language=DEFAULT_LANGUAGE):
+    return _main_menu(resolve_language(language))
+
+
+@lru_cache(maxsize=None)
+def _panel(language):
+    t = messages("common", language)
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [_button(t["btn_today_tasks"], TaskCB(action="today_tasks", problem_id=0))],
+        [_button(t["btn_all_tasks"], TaskCB(action="all_tasks", problem_id=0))],
+        [_button(t["cancel"], TaskCB(action="menu", problem_id=0))]
+    ])
+
+
+def panel(language=DEFAULT_LANGUAGE):
+    return _panel(resolve_language(language))
+
+
+@lru_cache(maxsize=None)
+def _back(language, action, factory):
+    callback_data = factory(action=action, problem_id=0).pack() if factory else action
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=messages("common", language)["cancel"], callback_data=callback_data)]
+    ])
+
+
+def back(language=DEFAULT_LANGUAGE, action="menu", factory=TaskCB):
+    # Single "back" button; `factory` is the CallbackData class whose handler owns `action`,
+    # or None when `action` already is the raw callback data (admin screens)
+    return _back(resolve_language(language), action, factory)
+
+
+@lru_cache(maxsize=None)
+def _languages(language):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [_button(LANGUAGE_NAMES.get(code, code), LanguageCB(lang=code))] for code in SUPPORTED_LANGUAGES
+    ] + [[_button(messages("common", language)["cancel"], TaskCB(action="menu", problem_id=0))]])
+
+
+def languages(language=DEFAULT_LANGUAGE):
+    return _languages(resolve_language(language))
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _task(language, problem_id, can_submit, back_action):
+    rows = [[_button(messages("common", language)["cancel"], TaskCB(action=back_action, problem_id=0))]]
+    if can_submit:
+        rows.insert(0, [_button(messages("common", language)["btn_submit"], ProblemCB(action="submit", problem_id=problem_id))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _submit(language, problem_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [_button(messages("common", language)["btn_submit"], ProblemCB(action="submit", problem_id=problem_id))]
+    ])
+
+
+def submit(problem_id, language=DEFAULT_LANGUAGE):
+    # Broadcast keyboard for a problem: only the submit button
+    return _submit(resolve_language(language), problem_id)
+
+
+def task(problem_id, can_submit, language=DEFAULT_LANGUAGE, back_action="panel"):
+    # Problem view: optional submit button above the back button
+    return _task(resolve_language(language), problem_id, can_submit, back_action)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _categories(language, names):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=name, callback_data=CategoryCB(category=name).pack())] for name in names
+    ] + [[_button(messages("common", language)["cancel"], ProblemCB(action="menu", problem_id=0))]])
+
+
+def categories(names, language=DEFAULT_LANGUAGE):
+    # Keyed by the category tuple, so a new category simply yields a new cache entry
+    return _categories(resolve_language(language), tuple(names))
+
+
+def cache_info():
+    # {builder: functools cache statistics}, for checking how often markups are reused
+    return {
+        "main_menu": _main_menu.cache_info(),
+        "panel": _panel.cache_info(),
+        "back": _back.cache_info(),
+        "languages": _languages.cache_info(),
+        "submit": _submit.cache_info(),
+        "task": _task.cache_info(),
+        "categories": _categories.cache_info(),
+    }
+
+
+def review(submission_id, language=DEFAULT_LANGUAGE, full=False, duplicate_of=None):
+    # Each submission is shown to a reviewer once, so this one is built per call. `full` adds a button
+    # for the original file when the reviewer was sent only a thumbnail, `duplicate_of` one for the
+    # earlier submission it was flagged against
+    t = messages("admin", language)
+    rows = [[
+        _button(t["btn_approve"], SubmissionCB(action="approve", submission_id=submission_id)),
+        _button(t["btn_reject"], SubmissionCB(action="reject", submission_id=submission_id)),
+    ]]
+    if full:
+        rows.append([_button(t["btn_full"], SubmissionCB(action="full", submission_id=submission_id))])
+    if duplicate_of:
+        rows.append([_button(t["btn_match"].format(id=duplicate_of),
+                             SubmissionCB(action="match", submission_id=duplicate_of))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def resubmit(submission_id, language=DEFAULT_LANGUAGE):
+    # Sent with a rejection, in the submitter's language; per submission, so not cached either
+    language = resolve_language(language)
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [_button(messages("user", language)["btn_resubmit"], SubmissionCB(action="resubmit", submission_id=submission_id))],
+        [_button(messages("common", language)["cancel"], TaskCB(action="menu", problem_id=0))]
+    ])
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+import zipfile
+from config.settings import MEDIA_DIR, MEDIA_SHARD_DEPTH, MEDIA_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Images live in a content-addressed store: a blob's path is derived from its SHA-256, so identical
+# uploads collapse into one file and no directory grows past 256 entries per shard level.
+# Downloads land in MEDIA_DIR/tmp and are renamed into place, so readers never see a partial file
+
+TMP_DIR = MEDIA_DIR / "tmp"
+
+
+class FileTooLarge(Exception):
+    def __init__(self, size):
+        super().__init__(f"File is {size} bytes, limit is {MEDIA_MAX_BYTES}")
+        self.size = size
+
+
+def too_large(size):
+    # Telegram reports file_size up front, so oversized files are refused before any transfer
+    return size is not None and size > MEDIA_MAX_BYTES
+
+
+def blob_path(digest, ext=""):
+    shards = [digest[i * 2:i * 2 + 2] for i in range(MEDIA_SHARD_DEPTH)]
+    return MEDIA_DIR.joinpath(*shards, digest + ext)
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _commit(tmp_path, ext):
+    # Move a finished download to its content address; a blob that already exists wins
+    digest = _hash_file(tmp_path)
+    path = blob_path(digest, ext)
+    if path.exists():
+        os.remove(tmp_path)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+    return str(path)
+
+
+def put_bytes(data, ext=".jpg"):
+    # Writes bytes into the store and returns their path; blocking, so run it off the event loop
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = TMP_DIR / f"{uuid.uuid4().hex}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    return _commit(tmp_path, ext)
+
+
+async def store_telegram_file(sender, file_id, ext=None, size=None):
+    # Downloads a Telegram file into the store and returns its path; raises FileTooLarge.
+    # Without `ext` the extension of Telegram's own file path is kept (photos come as .jpg)
+    if too_large(size):
+        raise FileTooLarge(size)
+    file = await sender.get_file(file_id)
+    if too_large(file.file_size):
+        raise FileTooLarge(file.file_size)
+
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = TMP_DIR / f"{uuid.uuid4().hex}.part"
+    try:
+        await sender.download_file(file.file_path, tmp_path)
+        if ext is None:
+            ext = os.path.splitext(file.file_path or "")[1] or ".jpg"
+        return await asyncio.to_thread(_commit, tmp_path, ext.lower())
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def read_blob(path):
+    # Returns a stored file's bytes; `archive.zip#member` references are read from the archive
+    if "#" not in path:
+        with open(path, "rb") as f:
+            return f.read()
+    archive, member = path.split("#", 1)
+    with zipfile.ZipFile(archive) as zf:
+        data = zf.read(member)
+    # Retention evicts the least recently read archives first
+    os.utime(archive)
+    return data
+
+
+def clear_tmp():
+    # Leftover .part files belong to downloads cut off by a restart
+    if not TMP_DIR.exists():
+        return
+    for entry in TMP_DIR.iterdir():
+        try:
+            entry.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove stale media download {entry}: {e}")
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from config.settings import TIMEZONE
+
+# Timestamps are stored as integer epoch seconds; this is the only place that converts them
+
+TEXT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def now_ts():
+    return int(datetime.now(TIMEZONE).timestamp())
+
+
+def to_ts(dt):
+    return int(dt.timestamp())
+
+
+def from_ts(ts):
+    return datetime.fromtimestamp(ts, TIMEZONE)
+
+
+def parse_text(value):
+    # Legacy TEXT timestamps are local (TIMEZONE) wall-clock times
+    return to_ts(datetime.strptime(value, TEXT_FORMAT).replace(tzinfo=TIMEZONE))
+
+
+def format_ts(ts):
+    return from_ts(ts).strftime(TEXT_FORMAT) if ts is not None else "—"
+
+
+def day_bounds(day):
+    # [start, end) of a calendar day in TIMEZONE, for indexed range filters
+    start = datetime(day.year, day.month, day.day, tzinfo=TIMEZONE)
+    return to_ts(start), to_ts(start + timedelta(days=1))
+
+
+def week_bounds(day):
+    # [start, end) of the Monday-based week containing `day`
+    monday = day - timedelta(days=day.weekday())
+    return day_bounds(monday)[0], day_bounds(monday + timedelta(days=7))[0]
+
+
+def month_bounds(day):
+    start, _ = day_bounds(day.replace(day=1))
+    first_of_next = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, day_bounds(first_of_next)[0]